@@ -22,12 +22,12 @@ public :
 // Fixed size dimensions of array or collections stored in the TTree if any.
 
    // Declaration of leaf types
-   Float_t         adc[1024];
-   Int_t           nhits;
+   UShort_t        adcUpstream[1024];
+   Short_t         nhitsUpstream;
 
    // List of branches
-   TBranch        *b_adc;   //!
-   TBranch        *b_nhits;   //!
+   TBranch        *b_adcUpstream;   //!
+   TBranch        *b_nhitsUpstream;   //!
 
    Analysis(TTree *tree=0);
    virtual ~Analysis();
@@ -99,8 +99,8 @@ void Analysis::Init(TTree *tree)
    fCurrent = -1;
    fChain->SetMakeClass(1);
 
-   fChain->SetBranchAddress("adc", adc, &b_adc);
-   fChain->SetBranchAddress("nhits", &nhits, &b_nhits);
+   fChain->SetBranchAddress("adcUpstream", adcUpstream, &b_adcUpstream);
+   fChain->SetBranchAddress("nhitsUpstream", &nhitsUpstream, &b_nhitsUpstream);
    Notify();
 }
 
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import CFDHitFinder as cfd
+import NumbaKernels as nk
+import Production as prod
+import Reconstruction as reco
+import SiPMWaveGen as swg
+import TimeMatcher as tm
+
+# Throughput of the simulation and reconstruction steps over a grid of occupancies (Poisson mean hits per
+# trigger) and waveform lengths. Per-event cases call the original single-waveform API in a loop, batch cases
+# hand the whole sample to the vectorized form. Results are stored as JSON so runs on different commits can be
+# compared with --compare.
+
+benchmarkFormat = 'tof-benchmark'
+benchmarkVersion = 1
+
+
+def makeInputs(nEvents, nsamples, meanHits, config, recoConfig, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, nsamples * config['dt'], config['dt'])[:nsamples]
+    inputs = {'t': t, 'volt': [], 'adc': [], 'hits': [], 'hitLists': []}
+    for channel in range(2):
+        volt = swg.waveGenBatch(t, nEvents, speAmplitude=config['speAmplitude'],
+                                noiseSigmaInVolt=config['noiseSigmaInVolt'], riseTime=config['riseTime'],
+                                fallTime=config['fallTime'], meanHits=meanHits, rng=rng)[0]
+        adc = swg.digitizeWave(volt, nBits=config['nBits'], voltMin=config['voltMin'],
+                               dynamicRange=config['dynamicRange'], offset=config['offset']).astype(float)
+        hits = cfd.HitFinderBatch(adc, noiseSigmaInVolt=recoConfig['noiseSigmaInVolt'],
+                                  cfdThreshold=recoConfig['cfdThreshold'],
+                                  nNoiseSigmaThreshold=recoConfig['nNoiseSigmaThreshold'], dt=recoConfig['dt'])
+        inputs['volt'].append(volt)
+        inputs['adc'].append(adc)
+        inputs['hits'].append(hits)
+        inputs['hitLists'].append(np.split(hits['cfdTime'], np.searchsorted(hits['event'], np.arange(1, nEvents))))
+    return inputs
+
+
+def perEvent(function):
+    def run(inputs, config, recoConfig):
+        for i in range(np.shape(inputs['adc'][0])[0]):
+            function(inputs, i, config, recoConfig)
+    return run
+
+
+def hitFinderArguments(recoConfig):
+    return dict(noiseSigmaInVolt=recoConfig['noiseSigmaInVolt'], cfdThreshold=recoConfig['cfdThreshold'],
+                nNoiseSigmaThreshold=recoConfig['nNoiseSigmaThreshold'])
+
+
+def digitizeArguments(config):
+    return dict(nBits=config['nBits'], voltMin=config['voltMin'], dynamicRange=config['dynamicRange'],
+                offset=config['offset'])
+
+
+def matchingArguments(recoConfig):
+    return dict(coincidenceWindowLowerLim=recoConfig['coincidenceWindowLowerLim'],
+                coincidenceWindowUpperLim=recoConfig['coincidenceWindowUpperLim'])
+
+
+# Twenty CFD fractions, the scan HitFinderCFDScan is meant for; compare with twenty HitFinderBatch calls.
+cfdScanThresholds = np.linspace(0.05, 0.95, 20)
+
+# name: [function(inputs, config, recoConfig), depends on occupancy]
+cases = {
+    'waveGen': [perEvent(lambda inputs, i, config, recoConfig: swg.waveGen(
+        inputs['t'], speAmplitude=config['speAmplitude'], noiseSigmaInVolt=config['noiseSigmaInVolt'],
+        riseTime=config['riseTime'], fallTime=config['fallTime'])), False],
+    'waveGenBatch': [lambda inputs, config, recoConfig: swg.waveGenBatch(
+        inputs['t'], np.shape(inputs['adc'][0])[0], speAmplitude=config['speAmplitude'],
+        noiseSigmaInVolt=config['noiseSigmaInVolt'], riseTime=config['riseTime'], fallTime=config['fallTime'],
+        meanHits=inputs['meanHits']), True],
+    'digitizeWave': [perEvent(lambda inputs, i, config, recoConfig: swg.digitizeWave(
+        inputs['volt'][0][i], **digitizeArguments(config))), False],
+    'digitizeWaveBatch': [lambda inputs, config, recoConfig: swg.digitizeWave(
+        inputs['volt'][0], **digitizeArguments(config)), False],
+    'RejectOutliers': [perEvent(lambda inputs, i, config, recoConfig: cfd.RejectOutliers(
+        inputs['adc'][0][i], m=3)), True],
+    'FindPedestalBatch': [lambda inputs, config, recoConfig: cfd.FindPedestalBatch(inputs['adc'][0], m=3), True],
+    'DiscriminatorConditioning': [perEvent(lambda inputs, i, config, recoConfig: cfd.DiscriminatorConditioning(
+        inputs['adc'][0][i], noiseSigmaInVolt=recoConfig['noiseSigmaInVolt'],
+        nNoiseSigmaThreshold=recoConfig['nNoiseSigmaThreshold'])), True],
+    'DiscriminatorConditioningBatch': [lambda inputs, config, recoConfig: cfd.DiscriminatorConditioningBatch(
+        inputs['adc'][0], noiseSigmaInVolt=recoConfig['noiseSigmaInVolt'],
+        nNoiseSigmaThreshold=recoConfig['nNoiseSigmaThreshold']), True],
+    'HitFinder': [perEvent(lambda inputs, i, config, recoConfig: cfd.HitFinder(
+        inputs['adc'][0][i], **hitFinderArguments(recoConfig))), True],
+    'HitFinderBatch': [lambda inputs, config, recoConfig: cfd.HitFinderBatch(
+        inputs['adc'][0], dt=recoConfig['dt'], **hitFinderArguments(recoConfig)), True],
+    'HitFinderCFDScan': [lambda inputs, config, recoConfig: cfd.HitFinderCFDScan(
+        inputs['adc'][0], noiseSigmaInVolt=recoConfig['noiseSigmaInVolt'], cfdThresholds=cfdScanThresholds,
+        nNoiseSigmaThreshold=recoConfig['nNoiseSigmaThreshold'], dt=recoConfig['dt']), True],
+    'TimeMatching': [perEvent(lambda inputs, i, config, recoConfig: tm.TimeMatching(
+        inputs['hitLists'][0][i], inputs['hitLists'][1][i], **matchingArguments(recoConfig))), True],
+    'TimeMatchingBatch': [lambda inputs, config, recoConfig: tm.TimeMatchingBatch(
+        inputs['hits'][0]['cfdTime'], inputs['hits'][1]['cfdTime'], eventUpstream=inputs['hits'][0]['event'],
+        eventDownstream=inputs['hits'][1]['event'], **matchingArguments(recoConfig)), True],
+}
+
+
+def timeCase(function, inputs, config, recoConfig, repeats):
+    # Best wall time over the repeats, then one more pass under tracemalloc for the peak allocation.
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        function(inputs, config, recoConfig)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(inputs, config, recoConfig)
+        peakMemory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return [min(times), peakMemory]
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(nEvents=500, nsamples=(256, 1024), meanHits=(1, 3, 10), names=None, repeats=3, seed=0,
+                  config=None, recoConfig=None, progress=None):
+    config = dict(prod.defaultConfig, **(config or {}))
+    recoConfig = dict(reco.defaultRecoConfig, **(recoConfig or {}))
+    names = list(cases) if names is None else names
+    unknown = [name for name in names if name not in cases]
+    if unknown:
+        raise ValueError('Unknown benchmark {0}, choose from {1}'.format(unknown, list(cases)))
+
+    results = []
+    for aLength in nsamples:
+        for aMean in meanHits:
+            inputs = makeInputs(nEvents, aLength, aMean, config, recoConfig, seed=seed)
+            inputs['meanHits'] = aMean
+            for name in names:
+                [function, occupancy] = cases[name]
+                if not occupancy and aMean != meanHits[0]:
+                    continue
+                # One untimed call so caches and JIT compilation are not charged to the first repeat.
+                function(inputs, config, recoConfig)
+                [seconds, peakMemory] = timeCase(function, inputs, config, recoConfig, repeats)
+                results.append({'name': name,
+                                'nsamples': aLength,
+                                'meanHits': aMean if occupancy else None,
+                                'nEvents': nEvents,
+                                'seconds': seconds,
+                                'eventsPerSecond': nEvents / seconds,
+                                'peakMemory': peakMemory})
+                if progress is not None:
+                    progress(results[-1])
+
+    return {'format': benchmarkFormat,
+            'version': benchmarkVersion,
+            'commit': gitCommit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'numba': nk.available,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeats': repeats,
+            'results': results}
+
+
+def resultKey(result):
+    return (result['name'], result['nsamples'], result['meanHits'])
+
+
+def formatResult(result, baseline=None):
+    line = '{0:<32}{1:>9}{2:>9}{3:>14.1f}{4:>12.2f}'.format(result['name'], result['nsamples'],
+                                                            '-' if result['meanHits'] is None else result['meanHits'],
+                                                            result['eventsPerSecond'],
+                                                            result['peakMemory'] / 2 ** 20)
+    if baseline is not None:
+        line = line + '{0:>10.2f}x'.format(result['eventsPerSecond'] / baseline['eventsPerSecond'])
+    return line
+
+
+def benchMain(argv=None):
+    parser = argparse.ArgumentParser(prog='tof-bench', description='Measure events/s and peak memory of the '
+                                                                    'simulation and reconstruction steps.')
+    parser.add_argument('-n', '--nevents', type=int, default=500)
+    parser.add_argument('--nsamples', type=int, nargs='+', default=[256, 1024])
+    parser.add_argument('--mean-hits', type=float, nargs='+', default=[1, 3, 10], help='Poisson mean hits per trigger')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-b', '--benchmarks', nargs='+', default=None, help='default: all of ' + ', '.join(cases))
+    parser.add_argument('-o', '--output', default='Benchmark.json')
+    parser.add_argument('--compare', default=None, help='earlier results to report speed-ups against')
+    args = parser.parse_args(argv)
+
+    baselines = {}
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baselines = {resultKey(aResult): aResult for aResult in json.load(f)['results']}
+
+    print('{0:<32}{1:>9}{2:>9}{3:>14}{4:>12}{5}'.format('benchmark', 'nsamples', 'hits', 'events/s', 'peak MiB',
+                                                       '   speed-up' if baselines else ''))
+    report = runBenchmarks(nEvents=args.nevents, nsamples=args.nsamples, meanHits=args.mean_hits,
+                           names=args.benchmarks, repeats=args.repeats, seed=args.seed,
+                           progress=lambda aResult: print(formatResult(aResult, baselines.get(resultKey(aResult)))))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('Wrote {0} results to {1}'.format(len(report['results']), args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(benchMain())
@@ -1,7 +1,31 @@
 import numpy as np
+import scipy.ndimage as ndi
 import scipy.signal as scisig
 
+import NumbaKernels as nk
+import Profiling as prof
 import SiPMWaveGen as swg
+from LRUCache import LRUCache
+
+hitDtype = np.dtype([('event', np.int64),
+                     ('channel', np.int16),
+                     ('cfdTime', np.float64),
+                     ('peakIndex', np.int64),
+                     ('peakAmplitude', np.float64),
+                     ('baseline', np.float64),
+                     ('noise', np.float64)])
+
+pulseDtype = np.dtype([('row', np.int64),
+                       ('start', np.int64),
+                       ('stop', np.int64),
+                       ('peakIndex', np.int64),
+                       ('peakAmplitude', np.float64),
+                       ('baseline', np.float64)])
+
+cfdInterpolationModes = ('midpoint', 'linear', 'cubic')
+
+backends = ('numpy', 'numba')
+defaultBackend = 'numba' if nk.available else 'numpy'
 
 
 def FindPedestal(p, m):
@@ -24,20 +48,276 @@ def RejectOutliers(data, m=2.):
     return data[s < m]
 
 
+def FindPedestalBatch(p, m):
+    # Row-wise FindPedestal: mean of the samples within m median absolute deviations of the median.
+    p = np.asarray(p, dtype=float)
+    d = np.abs(p - np.median(p, axis=1, keepdims=True))
+    mdev = np.median(d, axis=1, keepdims=True)
+    s = np.divide(d, mdev, out=np.zeros(np.shape(d)), where=mdev > 0)
+    keep = s < m
+    return np.sum(p, axis=1, where=keep) / np.count_nonzero(keep, axis=1)
+
+
+class RunningPedestal:
+    # Robust baseline and noise of one channel accumulated over events in an exponentially decaying histogram
+    # of ADC codes. The baseline is the FindPedestal estimate (mean within m MADs of the median) over the
+    # history, the noise 1.4826 MADs. Every waveform gets the estimate from the history up to and including
+    # itself. Per waveform that is one bincount over the codes plus searches in a window around the previous
+    # estimates, which keeps it cheaper than the two sorts FindPedestal needs. With numba the whole batch runs in
+    # one compiled loop over the events.
+
+    def __init__(self, decay=0.99, m=3, nBits=12, dynamicRange=1, offset=1000, backend=None):
+        self.backend = ResolveBackend(backend)
+        self.decay = decay
+        self.m = m
+        self.offset = offset
+        self.resolution = dynamicRange / (2 ** nBits - 1)
+        self.histogram = np.zeros(2 ** nBits)
+        self.codes = np.arange(2 ** nBits) + offset
+        self.nEvents = 0
+        self.baseline = None
+        self.median = None
+        self.mad = None
+        self.noise = None
+
+    def update(self, p):
+        # Returns [baseline, noise] per waveform, both in ADC counts.
+        p = np.reshape(p, (-1, np.shape(p)[-1]))
+        codes = np.clip(np.rint(p) - self.offset, 0, np.size(self.histogram) - 1).astype(np.intp)
+        [baseline, noise] = [np.empty(np.shape(p)[0]), np.empty(np.shape(p)[0])]
+        self.nEvents = self.nEvents + np.shape(p)[0]
+        if self.backend == 'numba':
+            # The same estimates computed over every code, which compiled is cheaper than keeping a window.
+            [baseline, mad, median] = nk.runningPedestalBatch(codes, self.histogram, self.decay, self.m, self.offset)
+            [self.baseline, self.mad, self.median] = [baseline[-1], int(mad[-1]), median + self.offset]
+            self.noise = 1.4826 * self.mad
+            return [baseline, 1.4826 * mad]
+
+        nCodes = np.size(self.histogram)
+        for i in range(np.shape(p)[0]):
+            self.histogram *= self.decay
+            self.histogram += np.bincount(codes[i], minlength=nCodes)
+            self.estimate()
+            [baseline[i], noise[i]] = [self.baseline, self.noise]
+        return [baseline, noise]
+
+    def estimate(self):
+        # The estimates move little from one waveform to the next, so they are first looked for in a window
+        # around the previous ones and only recomputed over every code if they turn out not to lie inside it.
+        nCodes = np.size(self.histogram)
+        estimates = None
+        if self.mad:
+            centre = self.median - self.offset
+            width = 2 * int(np.ceil(self.m * self.mad)) + 16
+            estimates = self.estimateIn(max(centre - width, 0), min(centre + width + 1, nCodes))
+        if estimates is None:
+            estimates = self.estimateIn(0, nCodes)
+        [median, self.mad, self.baseline] = estimates
+        self.median = median + self.offset
+        self.noise = 1.4826 * self.mad
+
+    def estimateIn(self, first, last):
+        # Returns [median, mad, baseline] from the codes in [first, last), or None if they need codes outside.
+        nCodes = np.size(self.histogram)
+        # extended[j] is the weight of all codes below first + j.
+        extended = np.empty(last - first + 1)
+        extended[0] = self.histogram[:first].sum()
+        self.histogram[first:last].cumsum(out=extended[1:])
+        extended[1:] += extended[0]
+        half = 0.5 * self.histogram.sum()
+        index = int(np.searchsorted(extended[1:], half))
+        if index == last - first or (index == 0 and extended[0] >= half):
+            return None
+        median = first + index
+
+        # Weight within each radius of the median, up to the largest radius the window holds. Radii reaching
+        # past either end of the codes clamp there, as the full computation does.
+        maxRadius = min(index if first > 0 else nCodes - 1, last - 1 - median if last < nCodes else nCodes - 1)
+        radius = np.arange(maxRadius + 1)
+        within = extended[np.minimum(index + radius + 1, last - first)] - extended[np.maximum(index - radius, 0)]
+        mad = int(np.searchsorted(within, half))
+        if mad > maxRadius and maxRadius < nCodes - 1:
+            return None
+        mad = min(mad, nCodes)
+
+        # Codes strictly within m MADs of the median, or all of them while the MAD is still zero.
+        [low, high] = [0, nCodes]
+        if mad > 0:
+            reach = int(np.ceil(self.m * mad)) - 1
+            [low, high] = [max(median - reach, 0), min(median + reach + 1, nCodes)]
+        if low < first or high > last:
+            return None
+        keep = self.histogram[low:high]
+        return [median, mad, keep.dot(self.codes[low:high]) / keep.sum()]
+
+    def noiseInVolt(self):
+        return None if self.noise is None else self.noise * self.resolution
+
+
+def ResolveBackend(backend=None):
+    backend = defaultBackend if backend is None else backend
+    if backend not in backends:
+        raise ValueError('backend must be one of {0}, got {1!r}'.format(backends, backend))
+    if backend == 'numba' and not nk.available:
+        raise ValueError('The numba backend needs Numba installed')
+    return backend
+
+
+savgolCache = LRUCache(maxSize=16)
+
+
+def CheckSavgolWindow(sgWindow, sgPolyOrder):
+    # Both smoothing backends split the window into a centred kernel and half edge rows on either side, which
+    # only adds up for odd windows.
+    if int(sgWindow) != sgWindow or sgWindow % 2 == 0 or sgWindow < sgPolyOrder + 2:
+        raise ValueError('sgWindow must be an odd integer of at least sgPolyOrder + 2 = {0}, got {1!r}'.format(
+            sgPolyOrder + 2, sgWindow))
+
+
+def MakeSavgolMatrix(sgWindow, sgPolyOrder):
+    matrix = scisig.savgol_filter(np.eye(sgWindow), window_length=sgWindow, polyorder=sgPolyOrder, axis=0)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def SavgolMatrix(sgWindow, sgPolyOrder):
+    # Row i gives sample i of the Savitzky-Golay output of a window-long input; the middle row is the FIR
+    # kernel used away from the edges, the others are scipy's 'interp' edge fits. Built once per
+    # (window, order) and shared.
+    return savgolCache.getOrCompute((sgWindow, sgPolyOrder), lambda: MakeSavgolMatrix(sgWindow, sgPolyOrder))
+
+
+def SmoothBatch(p, sgWindow=15, sgPolyOrder=3):
+    # savgol_filter(p, sgWindow, sgPolyOrder, axis=1) for a whole batch: one FIR correlation along the samples
+    # plus two small matrix products for the edge fits, with cached coefficients.
+    CheckSavgolWindow(sgWindow, sgPolyOrder)
+    p = np.asarray(p, dtype=float)
+    matrix = SavgolMatrix(sgWindow, sgPolyOrder)
+    half = sgWindow // 2
+    smoothed = ndi.correlate1d(p, matrix[half], axis=1, mode='constant')
+    smoothed[:, :half] = p[:, :sgWindow] @ matrix[:half].T
+    smoothed[:, np.shape(p)[1] - half:] = p[:, -sgWindow:] @ matrix[half + 1:].T
+    return smoothed
+
+
+class ThresholdDiscriminator:
+    # Everything that only depends on the configuration (noise in ADC counts, threshold offset, smoothing
+    # kernel) is fixed here, so a call just smooths, thresholds and extracts the pulse edges of a batch.
+
+    def __init__(self, noiseSigma, nNoiseSigmaThreshold=1, sgFilter=True, sgWindow=15, sgPolyOrder=3, nBits=12,
+                 dynamicRange=1, backend=None):
+        backend = ResolveBackend(backend)
+        if sgFilter:
+            CheckSavgolWindow(sgWindow, sgPolyOrder)
+        self.noiseInADC = swg.getRawADC(noiseSigma, dynamicRange / (2 ** nBits - 1))
+        self.nNoiseSigmaThreshold = nNoiseSigmaThreshold
+        self.thresholdOffset = nNoiseSigmaThreshold * self.noiseInADC
+        self.sgFilter = sgFilter
+        self.sgWindow = sgWindow
+        self.sgPolyOrder = sgPolyOrder
+        self.backend = backend
+        self.smoothing = SavgolMatrix(sgWindow, sgPolyOrder) if sgFilter else np.ones((1, 1))
+
+    def __call__(self, p, baseline, noise=None):
+        # noise, per waveform in ADC counts, replaces the configured noise where it is known and non-zero.
+        thresholdOffset = self.thresholdOffset
+        if noise is not None:
+            thresholdOffset = self.nNoiseSigmaThreshold * np.where(noise > 0, noise, self.noiseInADC)
+        threshold = np.asarray(baseline, dtype=float) - thresholdOffset
+        if self.backend == 'numba':
+            return nk.discriminateBatch(p, threshold, self.smoothing)
+        if self.sgFilter:
+            p = SmoothBatch(p, sgWindow=self.sgWindow, sgPolyOrder=self.sgPolyOrder)
+        hitLogic = p < threshold[:, None]
+        return [hitLogic, RunLengths(hitLogic)]
+
+
+discriminatorCache = LRUCache(maxSize=16)
+
+
+def GetDiscriminator(noiseSigma, nNoiseSigmaThreshold=1, sgFilter=True, sgWindow=15, sgPolyOrder=3, nBits=12,
+                     dynamicRange=1, backend=None):
+    key = (noiseSigma, nNoiseSigmaThreshold, sgFilter, sgWindow, sgPolyOrder, nBits, dynamicRange,
+           ResolveBackend(backend))
+    return discriminatorCache.getOrCompute(key, lambda: ThresholdDiscriminator(*key))
+
+
 def WaveformDiscriminator(p,
                           noiseSigma,
                           nNoiseSigmaThreshold=1,
                           sgFilter=True,
                           sgWindow=15,
-                          sgPolyOrder=3):
-    [baselineVal, noiseInADC] = FindDigitizedPedestal(p=p, m=3, nBits=12, dynamicRange=1, noiseSigma=noiseSigma)
-    if sgFilter:
-        filter_p = scisig.savgol_filter(x=p, window_length=sgWindow, polyorder=sgPolyOrder)
-        hitLogic = np.array(
-            [(True if pi < baselineVal - nNoiseSigmaThreshold * noiseInADC else False) for pi in filter_p])
+                          sgPolyOrder=3,
+                          pedestal=None,
+                          nBits=12,
+                          dynamicRange=1,
+                          backend=None):
+    discriminator = GetDiscriminator(noiseSigma, nNoiseSigmaThreshold, sgFilter, sgWindow, sgPolyOrder, nBits,
+                                     dynamicRange, backend)
+    if pedestal is None:
+        [baselineVal, noise] = [FindPedestal(p=p, m=3), None]
     else:
-        hitLogic = np.array([(True if pi < baselineVal - nNoiseSigmaThreshold * noiseInADC else False) for pi in p])
-    return [hitLogic, baselineVal, noiseInADC]
+        [baselineVal, noise] = [value[0] for value in pedestal.update(p)]
+    hitLogic = discriminator(np.reshape(p, (1, -1)), np.reshape(baselineVal, 1),
+                             noise=None if noise is None else np.reshape(noise, 1))[0][0]
+    return [hitLogic, baselineVal, discriminator.noiseInADC if noise is None or noise <= 0 else noise]
+
+
+def WaveformDiscriminatorBatch(p,
+                               noiseSigma,
+                               nNoiseSigmaThreshold=1,
+                               sgFilter=True,
+                               sgWindow=15,
+                               sgPolyOrder=3,
+                               pedestal=None,
+                               nBits=12,
+                               dynamicRange=1,
+                               backend=None):
+    # Also returns the (rows, starts, stops) runs of the hit logic so conditioning does not have to rescan it.
+    discriminator = GetDiscriminator(noiseSigma, nNoiseSigmaThreshold, sgFilter, sgWindow, sgPolyOrder, nBits,
+                                     dynamicRange, backend)
+    with prof.stage('pedestal', np.shape(p)[0]):
+        if pedestal is None:
+            [baselineVal, noise] = [FindPedestalBatch(p=p, m=3), None]
+        else:
+            [baselineVal, noise] = pedestal.update(p)
+    with prof.stage('discrimination', np.shape(p)[0]):
+        [hitLogic, runs] = discriminator(p, baselineVal, noise=noise)
+    # A running pedestal's noise is per waveform, and hit tables pick each pulse's own value out of it.
+    noiseSigma = discriminator.noiseInADC if noise is None else np.where(noise > 0, noise, discriminator.noiseInADC)
+    return [hitLogic, baselineVal, noiseSigma, runs]
+
+
+def RunLengths(logic):
+    # Runs of True in each row of a 2-D mask as (row, start, stop) with stop exclusive.
+    edges = np.diff(np.pad(logic.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    [rows, starts] = np.nonzero(edges == 1)
+    stops = np.nonzero(edges == -1)[1]
+    return [rows, starts, stops]
+
+
+def FillRuns(logic, rows, starts, stops, value):
+    marks = np.zeros((np.shape(logic)[0], np.shape(logic)[1] + 1), dtype=np.int8)
+    marks[rows, starts] = 1
+    marks[rows, stops] = -1
+    logic[np.cumsum(marks, axis=1)[:, :-1] > 0] = value
+
+
+def ConditionHitLogic(hitLogic, durationTheshold=5, adjDurationThreshold=5, runs=None):
+    # Drops pulses shorter than durationTheshold, then closes gaps shorter than adjDurationThreshold.
+    # Runs starting at the first sample are left alone and runs reaching the last sample count one
+    # sample short, as in the original edge-scanning loops. runs are the pulses of hitLogic if already known.
+    shape = np.shape(hitLogic)
+    nsamples = shape[-1]
+    logic = np.array(hitLogic, dtype=bool).reshape(-1, nsamples)
+
+    for [value, threshold] in [[False, durationTheshold], [True, adjDurationThreshold]]:
+        [rows, starts, stops] = runs if runs is not None and not value else RunLengths(logic != value)
+        durations = stops - starts - (stops == nsamples)
+        short = (starts > 0) & (durations > 0) & (durations < threshold)
+        FillRuns(logic, rows[short], starts[short], starts[short] + durations[short], value)
+
+    return logic.reshape(shape)
 
 
 def DiscriminatorConditioning(p,
@@ -47,39 +327,56 @@ def DiscriminatorConditioning(p,
                               nNoiseSigmaThreshold=1,
                               sgFilter=True,
                               sgWindow=15,
-                              sgPolyOrder=3):
+                              sgPolyOrder=3,
+                              pedestal=None,
+                              nBits=12,
+                              dynamicRange=1,
+                              backend=None):
     [hitLogic, baseline, noiseSigma] = WaveformDiscriminator(p=p,
                                                              noiseSigma=noiseSigmaInVolt,
                                                              nNoiseSigmaThreshold=nNoiseSigmaThreshold,
                                                              sgFilter=sgFilter,
                                                              sgWindow=sgWindow,
-                                                             sgPolyOrder=sgPolyOrder)
-
-    for i in range(1, np.size(hitLogic)):
-        if ((not hitLogic[i - 1]) and hitLogic[i]) and hitLogic[i]:
-            countDuration = 0
-            for j in range(i, np.size(hitLogic) - 1):
-                if hitLogic[j]:
-                    countDuration = countDuration + 1
-                if not hitLogic[j + 1]:
-                    break
-
-            if countDuration < durationTheshold:
-                for j in range(i, i + countDuration):
-                    hitLogic[j] = False
-
-    for i in range(1, np.size(hitLogic)):
-        if (hitLogic[i - 1] and (not hitLogic[i])) and (not hitLogic[i]):
-            countDuration = 0
-            for j in range(i, np.size(hitLogic) - 1):
-                if (not hitLogic[j]):
-                    countDuration = countDuration + 1
-                if hitLogic[j + 1]:
-                    break
-
-            if countDuration < adjDurationThreshold:
-                for j in range(i, i + countDuration):
-                    hitLogic[j] = True
+                                                             sgPolyOrder=sgPolyOrder,
+                                                             pedestal=pedestal,
+                                                             nBits=nBits,
+                                                             dynamicRange=dynamicRange,
+                                                             backend=backend)
+
+    hitLogic = ConditionHitLogic(hitLogic,
+                                 durationTheshold=durationTheshold,
+                                 adjDurationThreshold=adjDurationThreshold)
+
+    return [hitLogic, baseline, noiseSigma]
+
+
+def DiscriminatorConditioningBatch(p,
+                                   noiseSigmaInVolt,
+                                   durationTheshold=5,
+                                   adjDurationThreshold=5,
+                                   nNoiseSigmaThreshold=1,
+                                   sgFilter=True,
+                                   sgWindow=15,
+                                   sgPolyOrder=3,
+                                   pedestal=None,
+                                   nBits=12,
+                                   dynamicRange=1,
+                                   backend=None):
+    [hitLogic, baseline, noiseSigma, runs] = WaveformDiscriminatorBatch(p=p,
+                                                                        noiseSigma=noiseSigmaInVolt,
+                                                                        nNoiseSigmaThreshold=nNoiseSigmaThreshold,
+                                                                        sgFilter=sgFilter,
+                                                                        sgWindow=sgWindow,
+                                                                        sgPolyOrder=sgPolyOrder,
+                                                                        pedestal=pedestal,
+                                                                        nBits=nBits,
+                                                                        dynamicRange=dynamicRange,
+                                                                        backend=backend)
+    with prof.stage('conditioning', np.shape(p)[0]):
+        hitLogic = ConditionHitLogic(hitLogic,
+                                     durationTheshold=durationTheshold,
+                                     adjDurationThreshold=adjDurationThreshold,
+                                     runs=runs)
 
     return [hitLogic, baseline, noiseSigma]
 
@@ -92,7 +389,12 @@ def HitFinder(p,
               nNoiseSigmaThreshold=2.5,
               sgFilter=True,
               sgWindow=15,
-              sgPolyOrder=3):
+              sgPolyOrder=3,
+              cfdInterpolation='midpoint',
+              pedestal=None,
+              nBits=12,
+              dynamicRange=1,
+              backend=None):
     [hitLogic, baseline, noiseSigma] = DiscriminatorConditioning(p=p,
                                                                  noiseSigmaInVolt=noiseSigmaInVolt,
                                                                  durationTheshold=durationTheshold,
@@ -100,31 +402,249 @@ def HitFinder(p,
                                                                  nNoiseSigmaThreshold=nNoiseSigmaThreshold,
                                                                  sgFilter=sgFilter,
                                                                  sgWindow=sgWindow,
-                                                                 sgPolyOrder=sgPolyOrder)
-
-    hitStartIndexList = []
-    hitPeakAmplitude = []
-    hitPeakIndexArray = []
-    for i in range(1, np.size(hitLogic)):
-        if ((not hitLogic[i - 1]) and hitLogic[i]) and hitLogic[i]:
-            hitAmplitude = 1E100
-            hitPeakIndex = i
-            for j in range(i, np.size(hitLogic) - 1):
-                if p[j] < hitAmplitude:
-                    hitAmplitude = p[j]
-                    hitPeakIndex = j
-                if not hitLogic[j + 1]:
-                    break
-            ThresholdADC = baseline - (cfdThreshold * (baseline - hitAmplitude))
-
-            hitStartIndex = i
-            for j in range(hitPeakIndex, 0, -1):
-                if (p[j] <= ThresholdADC and p[j - 1] > ThresholdADC):
-                    hitStartIndex = j - 0.5
-                    break
-
-            hitStartIndexList = np.append(hitStartIndexList, hitStartIndex)
-            hitPeakAmplitude = np.append(hitPeakAmplitude, hitAmplitude)
-            hitPeakIndexArray = np.append(hitPeakIndexArray, hitPeakIndex)
-
-    return [hitStartIndexList, hitPeakAmplitude, hitPeakIndexArray, hitLogic, baseline, noiseSigma]
+                                                                 sgPolyOrder=sgPolyOrder,
+                                                                 pedestal=pedestal,
+                                                                 nBits=nBits,
+                                                                 dynamicRange=dynamicRange,
+                                                                 backend=backend)
+
+    return FindHits(p, hitLogic, baseline, noiseSigma, cfdThreshold=cfdThreshold, cfdInterpolation=cfdInterpolation,
+                    backend=backend)
+
+
+def FindHits(p, hitLogic, baseline, noiseSigma, cfdThreshold=0.2, cfdInterpolation='midpoint', backend=None,
+             pulses=None):
+    # The CFD part of HitFinder on its own, for callers that keep the discriminator output of one waveform and,
+    # optionally, its FindPulses table.
+    p = np.reshape(np.asarray(p, dtype=float), (1, -1))
+    if pulses is None:
+        pulses = FindPulses(p, np.reshape(hitLogic, (1, -1)), np.reshape(baseline, 1), backend=backend)
+    hits = FindHitsInPulses(p, pulses, noiseSigma, cfdThreshold=cfdThreshold, cfdInterpolation=cfdInterpolation,
+                            backend=backend)
+
+    return [hits['cfdTime'], hits['peakAmplitude'], hits['peakIndex'], hitLogic, baseline, noiseSigma]
+
+
+def HitFinderBatch(p,
+                   noiseSigmaInVolt,
+                   cfdThreshold=0.2,
+                   durationTheshold=10,
+                   adjDurationThreshold=5,
+                   nNoiseSigmaThreshold=2.5,
+                   sgFilter=True,
+                   sgWindow=15,
+                   sgPolyOrder=3,
+                   cfdInterpolation='midpoint',
+                   channel=0,
+                   firstEvent=0,
+                   dt=1.,
+                   pedestal=None,
+                   nBits=12,
+                   dynamicRange=1,
+                   backend=None):
+    # Converted once here, so the stages below get the float array as is instead of each converting the ADC codes.
+    p = np.asarray(p, dtype=float)
+    [hitLogic, baseline, noiseSigma] = DiscriminatorConditioningBatch(p=p,
+                                                                      noiseSigmaInVolt=noiseSigmaInVolt,
+                                                                      durationTheshold=durationTheshold,
+                                                                      adjDurationThreshold=adjDurationThreshold,
+                                                                      nNoiseSigmaThreshold=nNoiseSigmaThreshold,
+                                                                      sgFilter=sgFilter,
+                                                                      sgWindow=sgWindow,
+                                                                      sgPolyOrder=sgPolyOrder,
+                                                                      pedestal=pedestal,
+                                                                      nBits=nBits,
+                                                                      dynamicRange=dynamicRange,
+                                                                      backend=backend)
+
+    with prof.stage('cfd', np.shape(p)[0]):
+        return FindHitsInLogic(p=p,
+                               hitLogic=hitLogic,
+                               baseline=baseline,
+                               noiseSigma=noiseSigma,
+                               cfdThreshold=cfdThreshold,
+                               cfdInterpolation=cfdInterpolation,
+                               channel=channel,
+                               firstEvent=firstEvent,
+                               dt=dt,
+                               backend=backend)
+
+
+def HitFinderCFDScan(p,
+                     noiseSigmaInVolt,
+                     cfdThresholds,
+                     durationTheshold=10,
+                     adjDurationThreshold=5,
+                     nNoiseSigmaThreshold=2.5,
+                     sgFilter=True,
+                     sgWindow=15,
+                     sgPolyOrder=3,
+                     cfdInterpolation='midpoint',
+                     channel=0,
+                     firstEvent=0,
+                     dt=1.,
+                     pedestal=None,
+                     nBits=12,
+                     dynamicRange=1,
+                     backend=None):
+    # HitFinderBatch for several CFD fractions: discrimination, conditioning and pulse finding run once, only
+    # the crossing search runs per fraction. Returns one hit table per entry of cfdThresholds.
+    p = np.asarray(p, dtype=float)
+    [hitLogic, baseline, noiseSigma] = DiscriminatorConditioningBatch(p=p,
+                                                                      noiseSigmaInVolt=noiseSigmaInVolt,
+                                                                      durationTheshold=durationTheshold,
+                                                                      adjDurationThreshold=adjDurationThreshold,
+                                                                      nNoiseSigmaThreshold=nNoiseSigmaThreshold,
+                                                                      sgFilter=sgFilter,
+                                                                      sgWindow=sgWindow,
+                                                                      sgPolyOrder=sgPolyOrder,
+                                                                      pedestal=pedestal,
+                                                                      nBits=nBits,
+                                                                      dynamicRange=dynamicRange,
+                                                                      backend=backend)
+
+    with prof.stage('pulses', np.shape(p)[0]):
+        pulses = FindPulses(p, hitLogic, baseline, backend=backend)
+    hits = []
+    for aThreshold in cfdThresholds:
+        with prof.stage('cfd', np.shape(p)[0]):
+            hits.append(FindHitsInPulses(p, pulses, noiseSigma, cfdThreshold=aThreshold,
+                                         cfdInterpolation=cfdInterpolation, channel=channel, firstEvent=firstEvent,
+                                         dt=dt, backend=backend))
+    return hits
+
+
+def FindPeaks(p, rows, starts, stops):
+    # First minimum of each row segment [start, stop), gathered into one flat array and reduced with reduceat.
+    lengths = stops - starts
+    offsets = np.cumsum(lengths) - lengths
+    total = np.sum(lengths)
+    position = np.arange(total) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    values = p[np.repeat(rows, lengths), position]
+
+    peakAmplitude = np.minimum.reduceat(values, offsets)
+    candidates = np.where(values == np.repeat(peakAmplitude, lengths), np.arange(total), total)
+    peakIndex = position[np.minimum.reduceat(candidates, offsets)]
+    return [peakIndex, peakAmplitude]
+
+
+def ScanCFDCrossings(p, rows, peakIndex, threshold):
+    # Steps every pulse back from its peak together until p[j] <= threshold < p[j - 1].
+    crossingIndex = np.zeros(np.size(rows), dtype=int)
+    crossed = np.zeros(np.size(rows), dtype=bool)
+    j = peakIndex.copy()
+    active = np.arange(np.size(rows))
+    while np.size(active) > 0:
+        active = active[j[active] >= 1]
+        aboveThreshold = p[rows[active], j[active] - 1] > threshold[active]
+        found = (p[rows[active], j[active]] <= threshold[active]) & aboveThreshold
+        crossingIndex[active[found]] = j[active[found]]
+        crossed[active[found]] = True
+        active = active[~found]
+        j[active] = j[active] - 1
+    return [crossingIndex, crossed]
+
+
+def FindCFDCrossings(p, rows, starts, peakIndex, threshold, cfdInterpolation='midpoint', scan=None):
+    # Pulses that never cross keep their discriminator start, as in the single-waveform scan.
+    [crossingIndex, crossed] = ScanCFDCrossings(p, rows, peakIndex, threshold) if scan is None else scan
+    crossing = starts.astype(float)
+    crossing[crossed] = InterpolateCrossings(p, rows[crossed], crossingIndex[crossed], threshold[crossed],
+                                             cfdInterpolation=cfdInterpolation)
+    return crossing
+
+
+def InterpolateCrossings(p, rows, j, threshold, cfdInterpolation='midpoint', nBisections=24):
+    # Crossing time in samples between j - 1 and j. 'midpoint' reproduces the original j - 0.5, 'linear'
+    # joins the two bracketing samples and 'cubic' bisects the Catmull-Rom spline through j - 2 ... j + 1.
+    if cfdInterpolation == 'midpoint':
+        return j - 0.5
+
+    before = p[rows, j - 1]
+    after = p[rows, j]
+    crossing = j - 1 + (before - threshold) / (before - after)
+    if cfdInterpolation == 'linear':
+        return crossing
+
+    spline = np.nonzero((j >= 2) & (j + 1 < np.shape(p)[1]))[0]
+    [p0, p1, p2, p3] = [p[rows[spline], j[spline] + k] for k in [-2, -1, 0, 1]]
+    c1 = 0.5 * (p2 - p0)
+    c2 = 0.5 * (2 * p0 - 5 * p1 + 4 * p2 - p3)
+    c3 = 0.5 * (3 * (p1 - p2) + p3 - p0)
+    lower = np.zeros(np.size(spline))
+    upper = np.ones(np.size(spline))
+    for i in range(nBisections):
+        u = 0.5 * (lower + upper)
+        aboveThreshold = p1 + u * (c1 + u * (c2 + u * c3)) > threshold[spline]
+        lower = np.where(aboveThreshold, u, lower)
+        upper = np.where(aboveThreshold, upper, u)
+    crossing[spline] = j[spline] - 1 + 0.5 * (lower + upper)
+    return crossing
+
+
+def FindPulses(p, hitLogic, baseline, backend=None):
+    # The CFD-independent half of hit finding: one row per discriminator pulse with its span and first minimum.
+    # Runs that start at the first sample are not pulses, and stops are clipped to leave a sample to peak in.
+    p = np.asarray(p, dtype=float)
+    nsamples = np.shape(p)[1]
+
+    [rows, starts, stops] = RunLengths(hitLogic)
+    isPulse = starts > 0
+    [rows, starts, stops] = [rows[isPulse], starts[isPulse], stops[isPulse]]
+    stops = np.maximum(np.minimum(stops, nsamples - 1), starts + 1)
+
+    pulses = np.zeros(np.size(rows), dtype=pulseDtype)
+    if np.size(rows) == 0:
+        return pulses
+
+    if ResolveBackend(backend) == 'numba':
+        [peakIndex, peakAmplitude] = nk.findPeaksBatch(p, rows, starts, stops)
+    else:
+        [peakIndex, peakAmplitude] = FindPeaks(p, rows, starts, stops)
+
+    pulses['row'] = rows
+    pulses['start'] = starts
+    pulses['stop'] = stops
+    pulses['peakIndex'] = peakIndex
+    pulses['peakAmplitude'] = peakAmplitude
+    pulses['baseline'] = np.asarray(baseline)[rows]
+    return pulses
+
+
+def FindHitsInPulses(p, pulses, noiseSigma, cfdThreshold=0.2, cfdInterpolation='midpoint', channel=0, firstEvent=0,
+                     dt=1., backend=None):
+    # The CFD half: thresholds from each pulse's baseline and peak, then the crossing search.
+    if cfdInterpolation not in cfdInterpolationModes:
+        raise ValueError('cfdInterpolation must be one of {0}, got {1!r}'.format(cfdInterpolationModes,
+                                                                                  cfdInterpolation))
+    p = np.asarray(p, dtype=float)
+
+    hits = np.zeros(np.size(pulses), dtype=hitDtype)
+    if np.size(pulses) == 0:
+        return hits
+
+    [rows, peakIndex, peakAmplitude, baseline] = [pulses['row'], pulses['peakIndex'], pulses['peakAmplitude'],
+                                                  pulses['baseline']]
+    threshold = baseline - (cfdThreshold * (baseline - peakAmplitude))
+    if ResolveBackend(backend) == 'numba':
+        scan = nk.scanCrossingsBatch(p, rows, peakIndex, threshold)
+    else:
+        scan = ScanCFDCrossings(p, rows, peakIndex, threshold)
+
+    hits['event'] = firstEvent + rows
+    hits['channel'] = channel
+    hits['cfdTime'] = FindCFDCrossings(p, rows, pulses['start'], peakIndex, threshold,
+                                       cfdInterpolation=cfdInterpolation, scan=scan) * dt
+    hits['peakIndex'] = peakIndex
+    hits['peakAmplitude'] = peakAmplitude
+    hits['baseline'] = baseline
+    hits['noise'] = np.asarray(noiseSigma)[rows] if np.ndim(noiseSigma) else noiseSigma
+    return hits
+
+
+def FindHitsInLogic(p, hitLogic, baseline, noiseSigma, cfdThreshold=0.2, cfdInterpolation='midpoint', channel=0,
+                    firstEvent=0, dt=1., backend=None):
+    p = np.asarray(p, dtype=float)
+    pulses = FindPulses(p, hitLogic, baseline, backend=backend)
+    return FindHitsInPulses(p, pulses, noiseSigma, cfdThreshold=cfdThreshold, cfdInterpolation=cfdInterpolation,
+                            channel=channel, firstEvent=firstEvent, dt=dt, backend=backend)
@@ -1,22 +1,70 @@
+import os
 import sys
+import threading
+from functools import partial
 
 from PyQt5.QtWidgets import QApplication, QMainWindow, QMenu, QVBoxLayout, QSizePolicy, QMessageBox, QWidget, \
-    QPushButton, QLabel
+    QPushButton, QLabel, QProgressBar, QFileDialog, QSpinBox, QDoubleSpinBox
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 
 import SiPMWaveGen as swg
-import CFDHitFinder as cfd
 import TimeMatcher as tm
+import Production as prod
+from MinMaxPyramid import MinMaxPyramid
+from ReconstructionCache import ReconstructionCache
+from StoredRun import StoredRun
 
 import numpy as np
 
 import random
 
+# Hit finding in the GUI is one trigger at a time, where NumPy is fast enough. It runs on several pool threads
+# at once, which Numba's default workqueue threading layer does not allow, and its pool hangs at exit when first
+# started from a worker thread (see NumbaKernels.startThreads). NumPy also spares the first trigger the JIT compile.
+guiBackend = 'numpy'
+
+
+class WorkerSignals(QObject):
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    # Runs function(*args) on a QThreadPool thread. Signals are delivered on the GUI thread, so slots connected
+    # to them may touch widgets. With reportsProgress the function also receives progress(done, total) and
+    # cancelled() keyword arguments.
+
+    def __init__(self, function, *args, reportsProgress=False):
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.reportsProgress = reportsProgress
+        self.signals = WorkerSignals()
+        self.cancelRequested = threading.Event()
+
+    def cancel(self):
+        self.cancelRequested.set()
+
+    def run(self):
+        kwargs = {}
+        if self.reportsProgress:
+            kwargs = dict(progress=self.signals.progress.emit, cancelled=self.cancelRequested.is_set)
+        try:
+            result = self.function(*self.args, **kwargs)
+        except Exception as error:
+            self.signals.error.emit('{0}: {1}'.format(type(error).__name__, error))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
 
 class App(QMainWindow):
 
@@ -90,6 +138,67 @@ class App(QMainWindow):
         s3_button.move(1120, 440)
         s3_button.resize(180, 40)
 
+        s5_button = QPushButton('Make ROOT', self)
+        s5_button.setToolTip('Make ROOT file')
+        s5_button.setStyleSheet("background-color: green")
+        s5_button.move(1120, 500)
+        s5_button.resize(180, 40)
+
+        self.progressBar = QProgressBar(self)
+        self.progressBar.move(1120, 560)
+        self.progressBar.resize(180, 30)
+        self.progressBar.hide()
+
+        self.cancelButton = QPushButton('Cancel', self)
+        self.cancelButton.setToolTip('Stop making the ROOT file')
+        self.cancelButton.setStyleSheet("background-color: orange")
+        self.cancelButton.move(1120, 600)
+        self.cancelButton.resize(180, 40)
+        self.cancelButton.hide()
+
+        s6_button = QPushButton('Open Run', self)
+        s6_button.setToolTip('Browse the events of a stored run')
+        s6_button.setStyleSheet("background-color: green")
+        s6_button.move(1120, 660)
+        s6_button.resize(180, 40)
+
+        self.previousButton = QPushButton('<', self)
+        self.previousButton.setToolTip('Previous event')
+        self.previousButton.move(1120, 720)
+        self.previousButton.resize(50, 40)
+
+        self.eventBox = QSpinBox(self)
+        self.eventBox.setToolTip('Jump to event')
+        self.eventBox.setKeyboardTracking(False)
+        self.eventBox.move(1175, 720)
+        self.eventBox.resize(70, 40)
+
+        self.nextButton = QPushButton('>', self)
+        self.nextButton.setToolTip('Next event')
+        self.nextButton.move(1250, 720)
+        self.nextButton.resize(50, 40)
+
+        for aWidget in [self.previousButton, self.eventBox, self.nextButton]:
+            aWidget.setEnabled(False)
+
+        self.cfdThresholdBox = QDoubleSpinBox(self)
+        self.cfdThresholdBox.setToolTip('CFD fraction')
+        self.cfdThresholdBox.setRange(0.05, 0.95)
+        self.cfdThresholdBox.setSingleStep(0.05)
+        self.cfdThresholdBox.setValue(self.m.cfdThreshold)
+        self.cfdThresholdBox.setKeyboardTracking(False)
+        self.cfdThresholdBox.move(1120, 780)
+        self.cfdThresholdBox.resize(85, 40)
+
+        self.nNoiseSigmaThresholdBox = QDoubleSpinBox(self)
+        self.nNoiseSigmaThresholdBox.setToolTip('Hit threshold in noise sigmas')
+        self.nNoiseSigmaThresholdBox.setRange(0.5, 10.)
+        self.nNoiseSigmaThresholdBox.setSingleStep(0.5)
+        self.nNoiseSigmaThresholdBox.setValue(self.m.nNoiseSigmaThreshold)
+        self.nNoiseSigmaThresholdBox.setKeyboardTracking(False)
+        self.nNoiseSigmaThresholdBox.move(1215, 780)
+        self.nNoiseSigmaThresholdBox.resize(85, 40)
+
         self.label.move(40, 20)
         self.label.resize(1000, 60)
         self.label.setText("")
@@ -102,9 +211,20 @@ class App(QMainWindow):
         s1_button.clicked.connect(self.toggleHitThresholdClicked)
         s2_button.clicked.connect(self.toggleCFDThresholdClicked)
         s4_button.clicked.connect(self.toggleCoincidenceWindowClicked)
+        s5_button.clicked.connect(self.makeROOTFile)
+        self.cancelButton.clicked.connect(self.m.cancelROOTFile)
+        self.m.status.connect(self.label.setText)
 
         s3_button.clicked.connect(self.clearAll)
 
+        # The spin box holds the event being shown; the arrow buttons only step it.
+        s6_button.clicked.connect(self.openRun)
+        self.previousButton.clicked.connect(self.eventBox.stepDown)
+        self.nextButton.clicked.connect(self.eventBox.stepUp)
+        self.eventBox.valueChanged.connect(self.m.showRunEvent)
+        self.cfdThresholdBox.valueChanged.connect(self.m.setCFDThreshold)
+        self.nNoiseSigmaThresholdBox.valueChanged.connect(self.m.setNoiseSigmaThreshold)
+
         self.show()
 
     def waveGenButtonClicked(self):
@@ -135,38 +255,71 @@ class App(QMainWindow):
         self.m.toggleCoincidenceWindow()
         self.label.setText("")
 
+    def makeROOTFile(self):
+        if self.m.makeROOTFile(onProgress=self.showProgress, onFinished=self.productionFinished) is None:
+            return
+        self.label.setText("")
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+        self.cancelButton.show()
+
+    def showProgress(self, done, total):
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(done)
+
+    def productionFinished(self):
+        self.progressBar.hide()
+        self.cancelButton.hide()
+
+    def openRun(self):
+        [path, selected] = QFileDialog.getOpenFileName(self, 'Open Run', '', 'Runs (meta.json *.root)')
+        if not path:
+            return
+        if os.path.basename(path) == 'meta.json':
+            path = os.path.dirname(path)
+        try:
+            nEvents = self.m.openRun(path)
+        except (OSError, ValueError, KeyError) as error:
+            self.label.setText('Cannot open {0}: {1}'.format(path, error))
+            return
+        self.eventBox.blockSignals(True)
+        self.eventBox.setRange(0, max(nEvents - 1, 0))
+        self.eventBox.setValue(0)
+        self.eventBox.blockSignals(False)
+        for aWidget in [self.previousButton, self.eventBox, self.nextButton]:
+            aWidget.setEnabled(nEvents > 0)
+        if nEvents > 0:
+            self.m.showRunEvent(0)
+
     def clearAll(self):
         self.m.clearAll()
         self.label.setText("")
 
+    def closeEvent(self, event):
+        # Workers still running would signal into deleted objects.
+        self.m.cancelROOTFile()
+        self.m.threadPool.waitForDone()
+        super().closeEvent(event)
+
 
 class PlotCanvas(FigureCanvas):
+    status = pyqtSignal(str)
 
     def __init__(self, parent=None, width=5.5, height=4, dpi=100):
         self.showHitLines = False
-        self.hitLines1 = list()
-        self.hitLines2 = list()
-
         self.foundHits = False
-
         self.showToFRegions = False
-        self.ToFRegion1 = list()
-        self.ToFRegion2 = list()
-
         self.showPedestal = False
-        self.pedestalLines1 = list()
-        self.pedestalLines2 = list()
-
         self.showHitThreshold = False
-        self.hitThresholdLine1 = list()
-        self.hitThresholdLine2 = list()
-
         self.showCFDThreshold = False
-        self.cfdThresholdLine = list()
         self.nCFDThresholdClicks = 0
-
         self.nToggleCoincidenceWindowClicks = 0
-        self.coincidenceWindowRegions = list()
+
+        self.axesPair = list()
+        self.pyramids = list()
+        self.waveLines = list()
+        self.overlays = dict()
+        self.background = None
 
         self.dt = 0.2
         self.nsamples = 1024
@@ -210,6 +363,21 @@ class PlotCanvas(FigureCanvas):
 
         self.matchedHitList = []
 
+        self.threadPool = QThreadPool.globalInstance()
+        self.workers = set()
+        self.triggerNumber = 0
+        self.findingHits = False
+        self.pendingHitCallbacks = list()
+        self.productionWorker = None
+
+        self.reconstructionCache = ReconstructionCache(maxSize=512)
+        self.eventId = None
+
+        self.run = None
+        self.runEvent = 0
+        self.prefetching = set()
+        self.prefetchDepth = 8
+
         fig = Figure(figsize=(width, height), dpi=dpi)
         self.axes = fig.add_subplot(111)
 
@@ -220,455 +388,498 @@ class PlotCanvas(FigureCanvas):
                                    QSizePolicy.Expanding,
                                    QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
+        self.mpl_connect('draw_event', self.onDraw)
+        self.mpl_connect('resize_event', self.onResize)
+        self.mpl_connect('scroll_event', self.onScroll)
 
         self.plotWave()
 
-    def trigGen(self):
-        self.showHitLines = False
-        self.foundHits = False
-        self.showToFRegions = False
-        self.showPedestal = False
-        self.showHitThreshold = False
-        self.showCFDThreshold = False
-        self.nCFDThresholdClicks = 0
-        self.nToggleCoincidenceWindowClicks = 0
+    def startWorker(self, function, *args, onResult=None, onProgress=None, onFinished=(), reportsProgress=False,
+                    priority=0):
+        # Slots are connected before the worker starts, a short job may otherwise emit before anyone listens.
+        worker = Worker(function, *args, reportsProgress=reportsProgress)
+        if onResult is not None:
+            worker.signals.result.connect(onResult)
+        if onProgress is not None:
+            worker.signals.progress.connect(onProgress)
+        for aSlot in onFinished:
+            worker.signals.finished.connect(aSlot)
+        worker.signals.error.connect(self.status.emit)
+        worker.signals.finished.connect(partial(self.workers.discard, worker))
+        self.workers.add(worker)
+        self.threadPool.start(worker, priority)
+        return worker
+
+    def openRun(self, path):
+        # Takes over the run's simulation settings so axes and overlays fit its waveforms. A previous run is
+        # only dropped, not closed, since prefetch workers may still be reading it.
+        run = StoredRun(path, config=dict(cfdThreshold=self.cfdThreshold,
+                                          nNoiseSigmaThreshold=self.nNoiseSigmaThreshold,
+                                          coincidenceWindowLowerLim=self.coincidenceWindowLowerLim,
+                                          coincidenceWindowUpperLim=self.coincidenceWindowUpperLim),
+                        backend=guiBackend, reconstructionCache=self.reconstructionCache)
+        for key in prod.defaultConfig:
+            if key in run.attributes:
+                setattr(self, key, run.attributes[key])
+        self.nsamples = run.nsamples
+        self.axesPair = list()
+        self.run = run
+        self.runEvent = 0
+        self.prefetching = set()
+        return run.nEvents
+
+    def showRunEvent(self, event):
+        if self.run is None:
+            return
+        self.runEvent = min(max(event, 0), self.run.nEvents - 1)
+        parameters = self.hitParameters()
+        if self.run.isLoaded(self.runEvent, **parameters):
+            self.showStoredEvent(self.run.load(self.runEvent, **parameters), parameters)
+        else:
+            self.status.emit('Loading event {0} of {1}'.format(self.runEvent, self.run.nEvents))
+            self.loadEvent(self.runEvent, priority=1)
+        self.prefetch()
+
+    def loadEvent(self, event, priority=0):
+        if event in self.prefetching:
+            return
+        self.prefetching.add(event)
+        parameters = self.hitParameters()
+        self.startWorker(partial(self.run.load, event, **parameters),
+                         onResult=partial(self.eventLoaded, self.run, event, parameters),
+                         onFinished=[partial(self.prefetching.discard, event)], priority=priority)
+
+    def eventLoaded(self, run, event, parameters, channels):
+        if run is self.run and event == self.runEvent and parameters == self.hitParameters():
+            self.showStoredEvent(channels, parameters)
+
+    def prefetch(self):
+        # Keeps the previous event and the next prefetchDepth ones read and hit-found in the run's cache.
+        for event in [self.runEvent - 1] + list(range(self.runEvent + 1, self.runEvent + 1 + self.prefetchDepth)):
+            if 0 <= event < self.run.nEvents and not self.run.isLoaded(event, **self.hitParameters()):
+                self.loadEvent(event)
+
+    def showStoredEvent(self, channels, parameters):
+        # Stored events arrive with their hits, so the overlays are ready as soon as the waveforms are drawn.
+        t = np.arange(self.nsamples) * self.dt
+        self.showTriggers([[t, channel[0], []] for channel in channels], keepRange=True,
+                          eventId=(self.run.path, self.runEvent))
+        self.storeHits([self.triggerNumber, parameters] + [channel[1:] for channel in channels])
+        self.status.emit('Event {0} of {1} in {2}'.format(self.runEvent, self.run.nEvents, self.run.path))
+
+    def makeROOTFile(self, onProgress=None, onFinished=None):
+        # Returns the running worker, or None if one is already running. onProgress(done, total) and onFinished()
+        # let the window follow it.
+        if self.productionWorker is not None:
+            return None
+        self.productionWorker = self.startWorker(partial(prod.produceEvents, 2000, 'Waveform.root', chunkSize=100,
+                                                         config=dict(dt=self.dt,
+                                                                     nsamples=self.nsamples,
+                                                                     speAmplitude=self.speAmplitude,
+                                                                     noiseSigmaInVolt=self.noiseSigmaInVolt,
+                                                                     riseTime=self.riseTime,
+                                                                     fallTime=self.fallTime,
+                                                                     nBits=self.nBits,
+                                                                     voltMin=self.voltMin,
+                                                                     dynamicRange=self.dynamicRange,
+                                                                     offset=self.offset)),
+                                                 onResult=self.rootFileMade,
+                                                 onProgress=onProgress,
+                                                 onFinished=[aSlot for aSlot in [self.productionFinished, onFinished]
+                                                             if aSlot is not None],
+                                                 reportsProgress=True)
+        return self.productionWorker
+
+    def cancelROOTFile(self):
+        if self.productionWorker is not None:
+            self.productionWorker.cancel()
+
+    def rootFileMade(self, entropy):
+        if entropy is None:
+            self.status.emit('Cancelled, no ROOT file written')
+        else:
+            self.status.emit('Wrote 2000 events to Waveform.root (seed {0})'.format(entropy))
 
-        [self.t1, self.data1, self.true_data1] = swg.aDigitizedTrigger(dt=self.dt,
-                                                                       nsamples=self.nsamples,
-                                                                       speAmplitude=self.speAmplitude,
-                                                                       noiseSigmaInVolt=self.noiseSigmaInVolt,
-                                                                       riseTime=self.riseTime,
-                                                                       fallTime=self.fallTime,
-                                                                       nBits=self.nBits,
-                                                                       voltMin=self.voltMin,
-                                                                       dynamicRange=self.dynamicRange,
-                                                                       offset=self.offset)
-
-        [self.t2, self.data2, self.true_data2] = swg.aDigitizedTrigger(dt=self.dt,
-                                                                       nsamples=self.nsamples,
-                                                                       speAmplitude=self.speAmplitude,
-                                                                       noiseSigmaInVolt=self.noiseSigmaInVolt,
-                                                                       riseTime=self.riseTime,
-                                                                       fallTime=self.fallTime,
-                                                                       nBits=self.nBits,
-                                                                       voltMin=self.voltMin,
-                                                                       dynamicRange=self.dynamicRange,
-                                                                       offset=self.offset)
+    def productionFinished(self):
+        self.productionWorker = None
+
+    def trigGen(self):
+        # Runs on a worker thread, so it only returns the two triggers and leaves the canvas alone.
+        return [swg.aDigitizedTrigger(dt=self.dt,
+                                      nsamples=self.nsamples,
+                                      speAmplitude=self.speAmplitude,
+                                      noiseSigmaInVolt=self.noiseSigmaInVolt,
+                                      riseTime=self.riseTime,
+                                      fallTime=self.fallTime,
+                                      nBits=self.nBits,
+                                      voltMin=self.voltMin,
+                                      dynamicRange=self.dynamicRange,
+                                      offset=self.offset) for channel in range(2)]
 
     def plotWave(self):
-        self.trigGen()
+        self.startWorker(self.trigGen, onResult=self.showTriggers)
 
-        self.figure.clear()
-        self.figure.tight_layout()
+    def showTriggers(self, triggers, keepRange=False, eventId=None):
+        # Hits still being found for the previous trigger are dropped when they arrive. eventId names the
+        # waveforms in the reconstruction cache; generated triggers are never seen again, so they get a fresh one.
+        self.triggerNumber = self.triggerNumber + 1
+        self.eventId = ('trigger', self.triggerNumber) if eventId is None else eventId
+        self.foundHits = False
+        self.findingHits = False
+        self.pendingHitCallbacks = list()
+        [[self.t1, self.data1, self.true_data1], [self.t2, self.data2, self.true_data2]] = triggers
+
+        self.resetToggles()
+        self.removeOverlays()
+        self.background = None
+
+        # The axes are kept from trigger to trigger, rebuilding their ticks costs as much as drawing them.
+        if not self.axesPair:
+            self.makeAxes()
+        self.pyramids = [MinMaxPyramid(self.t1, self.data1), MinMaxPyramid(self.t2, self.data2)]
+        for ax in self.axesPair:
+            if keepRange:
+                self.updateLevelOfDetail(ax)
+            else:
+                ax.set_xlim((0, self.nsamples * self.dt))
 
-        ax = self.figure.add_subplot(211)
-        ax.plot(self.t1, self.data1)
-        ax.set_xlabel('Time (ns)')
-        ax.set_ylabel('Upstream (ADC)')
-        ax.set_xlim((0, self.nsamples * self.dt))
-        ax.set_ylim((self.offset, self.offset + (2 ** self.nBits)))
+        self.draw()
 
-        ax = self.figure.add_subplot(212)
-        ax.plot(self.t2, self.data2)
-        ax.set_xlabel('Time (ns)')
-        ax.set_ylabel('Downstream (ADC)')
-        ax.set_xlim((0, self.nsamples * self.dt))
-        ax.set_ylim((self.offset, self.offset + (2 ** self.nBits)))
+    def makeAxes(self):
+        self.figure.clear()
+        self.figure.tight_layout()
 
+        self.axesPair = [self.figure.add_subplot(211), self.figure.add_subplot(212)]
+        self.waveLines = list()
+        for [ax, name] in zip(self.axesPair, ['Upstream', 'Downstream']):
+            ax.set_xlabel('Time (ns)')
+            ax.set_ylabel('{0} (ADC)'.format(name))
+            ax.set_xlim((0, self.nsamples * self.dt))
+            ax.set_ylim((self.offset, self.offset + (2 ** self.nBits)))
+            self.waveLines.append(ax.plot([], [])[0])
+            ax.callbacks.connect('xlim_changed', self.updateLevelOfDetail)
+
+    def updateLevelOfDetail(self, ax):
+        # Redraws a channel from its min/max pyramid at the resolution of the axes' current pixel width and range.
+        channel = self.axesPair.index(ax)
+        [tMin, tMax] = ax.get_xlim()
+        self.waveLines[channel].set_data(*self.pyramids[channel].select(tMin, tMax, ax.get_window_extent().width))
+
+    def onResize(self, event):
+        for ax in self.axesPair:
+            self.updateLevelOfDetail(ax)
+
+    def onScroll(self, event):
+        # The wheel zooms both channels around the cursor, down to 20 samples and out to the whole record.
+        if event.inaxes not in self.axesPair:
+            return
+        scale = 0.8 if event.button == 'up' else 1.25
+        [tMin, tMax] = event.inaxes.get_xlim()
+        span = min(max((tMax - tMin) * scale, 20 * self.dt), self.nsamples * self.dt)
+        tMin = min(max(event.xdata - (event.xdata - tMin) / (tMax - tMin) * span, 0), self.nsamples * self.dt - span)
+        for ax in self.axesPair:
+            ax.set_xlim((tMin, tMin + span))
         self.draw()
 
-    def clearAll(self):
+    def resetToggles(self):
         self.showHitLines = False
-        self.foundHits = False
         self.showToFRegions = False
         self.showPedestal = False
         self.showHitThreshold = False
         self.showCFDThreshold = False
         self.nCFDThresholdClicks = 0
+        self.nToggleCoincidenceWindowClicks = 0
 
-        self.figure.clear()
-        self.figure.tight_layout()
+    def clearAll(self):
+        # The hits and their overlays stay valid for this trigger, so clearing only hides them.
+        self.resetToggles()
+        for name in self.overlays:
+            self.setOverlay(name, [])
+        self.blitOverlays()
+
+    def onDraw(self, event):
+        # Every full draw (new trigger, resize) skips the animated overlays, so it is the background they are
+        # blitted onto; the visible ones are then painted on top.
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self.drawOverlays()
+
+    def drawOverlays(self):
+        for groups in self.overlays.values():
+            for group in groups:
+                for anArtist in group:
+                    if anArtist.get_visible():
+                        self.figure.draw_artist(anArtist)
+
+    def blitOverlays(self):
+        if self.background is None:
+            self.draw()
+            return
+        self.restore_region(self.background)
+        self.drawOverlays()
+        self.blit(self.figure.bbox)
+
+    def removeOverlays(self):
+        for groups in self.overlays.values():
+            for group in groups:
+                for anArtist in group:
+                    anArtist.remove()
+        self.overlays = dict()
+
+    def setOverlay(self, name, shownGroups):
+        # Overlays are only built once something is first shown, so stepping through events skips them.
+        if not self.overlays:
+            self.makeOverlays()
+        for i, group in enumerate(self.overlays.get(name, [])):
+            for anArtist in group:
+                anArtist.set_visible(i in shownGroups)
+
+    def makeOverlays(self):
+        # Built once per trigger from its hits. Each overlay is a list of artist groups that the toggles
+        # show or hide: one group per channel, or one per hit for the CFD and coincidence window views.
+        self.matchedHitList = tm.TimeMatching(hitListUpstream=self.hitStartIndexList1 * self.dt,
+                                              hitListDownstream=self.hitStartIndexList2 * self.dt,
+                                              coincidenceWindowLowerLim=self.coincidenceWindowLowerLim,
+                                              coincidenceWindowUpperLim=self.coincidenceWindowUpperLim)
+        self.overlays = {name: list() for name in ['hitLines', 'tof', 'pedestal', 'hitThreshold', 'cfdThreshold',
+                                                   'coincidenceWindow']}
+        channels = [[self.t1, self.hitStartIndexList1, self.hitPeakAmplitude1, self.hitPeakIndex1, self.hitLogic1,
+                     self.baseline1, self.noiseSigma1],
+                    [self.t2, self.hitStartIndexList2, self.hitPeakAmplitude2, self.hitPeakIndex2, self.hitLogic2,
+                     self.baseline2, self.noiseSigma2]]
+
+        for [ax, [t, hitStartIndexList, hitPeakAmplitude, hitPeakIndex, hitLogic, baseline, noiseSigma]] in zip(
+                self.axesPair, channels):
+            hitLines = list()
+            for x in hitStartIndexList:
+                hitLines.append(ax.axvline(x=x * self.dt, color='#F6553C'))
+                hitLines.append(ax.text(x * self.dt - 1, self.offset + 1200, "{0:.1f} ns".format(x * self.dt),
+                                        rotation=90,
+                                        size=18,
+                                        horizontalalignment='right',
+                                        verticalalignment='top',
+                                        multialignment='center',
+                                        color='#F6553C'))
+            self.overlays['hitLines'].append(hitLines)
+
+            self.overlays['tof'].append([ax.axvspan(x1, x2, facecolor='#37A055', alpha=0.5)
+                                         for [x1, x2] in self.matchedHitList])
+
+            self.overlays['pedestal'].append([ax.axhline(baseline, color='#F36E19'),
+                                              ax.fill_between(x=t,
+                                                              y1=baseline - noiseSigma,
+                                                              y2=baseline + noiseSigma,
+                                                              facecolor='#F36E19',
+                                                              alpha=0.7),
+                                              ax.text(5, baseline + 200, "Baseline and Noise-band",
+                                                      rotation=0,
+                                                      size=18,
+                                                      horizontalalignment='left',
+                                                      verticalalignment='bottom',
+                                                      multialignment='center',
+                                                      color='#F36E19')])
+
+            self.overlays['hitThreshold'].append([ax.plot(t, hitLogic * 100000 - 50000, color='#2A2A2A')[0],
+                                                  ax.axhline(baseline - self.nNoiseSigmaThreshold * noiseSigma,
+                                                             color='#2A2A2A')])
+
+            for [peakAmplitude, peakIndex, startIndex] in zip(hitPeakAmplitude, hitPeakIndex, hitStartIndexList):
+                threshold = baseline - self.cfdThreshold * (baseline - peakAmplitude)
+                self.overlays['cfdThreshold'].append([ax.axhline(baseline, color='#13874B'),
+                                                      ax.axhline(peakAmplitude, color='#13874B'),
+                                                      ax.axhline(threshold, color='#13874B'),
+                                                      ax.plot(peakIndex * self.dt, peakAmplitude, 'o',
+                                                              color='#13874B')[0],
+                                                      ax.plot(startIndex * self.dt, threshold, 'o',
+                                                              color='#13874B')[0],
+                                                      ax.text(startIndex * self.dt - 15,
+                                                              threshold - 240,
+                                                              "{0:.1f}%".format(self.cfdThreshold * 100),
+                                                              rotation=0,
+                                                              size=14,
+                                                              horizontalalignment='left',
+                                                              verticalalignment='bottom',
+                                                              multialignment='center',
+                                                              color='#13874B')])
+
+        [upstream, downstream] = self.axesPair
+        for t0 in self.hitStartIndexList1 * self.dt:
+            x1 = t0 + self.coincidenceWindowLowerLim
+            x2 = min(t0 + self.coincidenceWindowUpperLim, self.nsamples * self.dt)
+            self.overlays['coincidenceWindow'].append([downstream.axvline(x=t0, color='#EA4335', linestyle='--'),
+                                                       downstream.axvspan(x1, x2, facecolor='#EA4335', alpha=0.5),
+                                                       downstream.text(x1 - 4,
+                                                                       self.offset + 200,
+                                                                       "t0 + {0:.1f} ns".format(
+                                                                           self.coincidenceWindowLowerLim),
+                                                                       rotation=90,
+                                                                       size=14,
+                                                                       horizontalalignment='left',
+                                                                       verticalalignment='bottom',
+                                                                       multialignment='center',
+                                                                       color='#EA4335'),
+                                                       downstream.text(x2 - 4,
+                                                                       self.offset + 200,
+                                                                       "t0 + {0:.1f} ns".format(
+                                                                           self.coincidenceWindowUpperLim),
+                                                                       rotation=90,
+                                                                       size=14,
+                                                                       horizontalalignment='left',
+                                                                       verticalalignment='bottom',
+                                                                       multialignment='center',
+                                                                       color='#EA4335'),
+                                                       upstream.axvline(x=t0, color='#EA4335'),
+                                                       upstream.text(t0 - 1,
+                                                                     self.offset + 1200,
+                                                                     "{0:.1f} ns".format(t0),
+                                                                     rotation=90,
+                                                                     size=18,
+                                                                     horizontalalignment='right',
+                                                                     verticalalignment='top',
+                                                                     multialignment='center',
+                                                                     color='#F6553C')])
+
+        for groups in self.overlays.values():
+            for group in groups:
+                for anArtist in group:
+                    anArtist.set_animated(True)
+                    anArtist.set_visible(False)
+
+    def hitParameters(self):
+        return dict(noiseSigmaInVolt=self.noiseSigmaInVolt,
+                    cfdThreshold=self.cfdThreshold,
+                    nNoiseSigmaThreshold=self.nNoiseSigmaThreshold,
+                    nBits=self.nBits,
+                    dynamicRange=self.dynamicRange,
+                    backend=guiBackend)
+
+    def computeHits(self, triggerNumber, eventId, parameters, data1, data2):
+        return [triggerNumber, parameters] + [self.reconstructionCache.findHits(eventId, channel, data, **parameters)
+                                              for channel, data in enumerate([data1, data2])]
+
+    def withHits(self, callback):
+        # Runs callback once the current trigger's hits are known, finding them on the pool first if needed.
+        # Clicks before the first trigger has arrived are ignored.
+        if self.triggerNumber == 0:
+            return
+        if self.foundHits:
+            callback()
+            return
+        self.pendingHitCallbacks.append(callback)
+        if not self.findingHits:
+            self.findingHits = True
+            self.startWorker(self.computeHits, self.triggerNumber, self.eventId, self.hitParameters(), self.data1,
+                             self.data2, onResult=self.storeHits)
+
+    def storeHits(self, result):
+        [triggerNumber, parameters, hits1, hits2] = result
+        if triggerNumber != self.triggerNumber or parameters != self.hitParameters():
+            return
+        [self.hitStartIndexList1,
+         self.hitPeakAmplitude1,
+         self.hitPeakIndex1,
+         self.hitLogic1,
+         self.baseline1,
+         self.noiseSigma1] = hits1
+        [self.hitStartIndexList2,
+         self.hitPeakAmplitude2,
+         self.hitPeakIndex2,
+         self.hitLogic2,
+         self.baseline2,
+         self.noiseSigma2] = hits2
+        self.findingHits = False
+        self.foundHits = True
 
-        ax = self.figure.add_subplot(211)
-        ax.plot(self.t1, self.data1)
-        ax.set_xlabel('Time (ns)')
-        ax.set_ylabel('Upstream (V)')
-        ax.set_xlim((0, self.nsamples * self.dt))
-        ax.set_ylim((self.offset, self.offset + (2 ** self.nBits)))
+        callbacks = self.pendingHitCallbacks
+        self.pendingHitCallbacks = list()
+        for callback in callbacks:
+            callback()
 
-        ax = self.figure.add_subplot(212)
-        ax.plot(self.t2, self.data2)
-        ax.set_xlabel('Time (ns)')
-        ax.set_ylabel('Downstream (V)')
-        ax.set_xlim((0, self.nsamples * self.dt))
-        ax.set_ylim((self.offset, self.offset + (2 ** self.nBits)))
+    def setCFDThreshold(self, cfdThreshold):
+        self.setHitFinderParameters(cfdThreshold=cfdThreshold)
 
-        self.draw()
+    def setNoiseSigmaThreshold(self, nNoiseSigmaThreshold):
+        self.setHitFinderParameters(nNoiseSigmaThreshold=nNoiseSigmaThreshold)
+
+    def setHitFinderParameters(self, **parameters):
+        # Hits for values seen before come straight from the reconstruction cache, a new CFD fraction only
+        # reruns the crossing search. Whatever is shown is redrawn from the new hits.
+        for name, value in parameters.items():
+            setattr(self, name, value)
+        self.foundHits = False
+        self.findingHits = False
+        self.pendingHitCallbacks = list()
+        self.removeOverlays()
+        if self.run is not None:
+            self.prefetch()
+        if self.showHitLines or self.showToFRegions or self.showPedestal or self.showHitThreshold or \
+                self.nCFDThresholdClicks > 0 or self.nToggleCoincidenceWindowClicks > 0:
+            self.withHits(self.redrawOverlays)
+
+    def redrawOverlays(self):
+        for draw in [self.drawHitLines, self.drawTOF, self.drawPedestal, self.drawHitThreshold,
+                     self.drawCFDThreshold, self.drawCoincidenceWindow]:
+            draw()
 
     def findHits(self):
         self.showHitLines = not self.showHitLines
+        self.withHits(self.drawHitLines)
 
-        if not self.foundHits:
-            [self.hitStartIndexList1,
-             self.hitPeakAmplitude1,
-             self.hitPeakIndex1,
-             self.hitLogic1,
-             self.baseline1,
-             self.noiseSigma1] = cfd.HitFinder(p=self.data1,
-                                               noiseSigmaInVolt=self.noiseSigmaInVolt,
-                                               cfdThreshold=self.cfdThreshold,
-                                               nNoiseSigmaThreshold=self.nNoiseSigmaThreshold)
-
-            [self.hitStartIndexList2,
-             self.hitPeakAmplitude2,
-             self.hitPeakIndex2,
-             self.hitLogic2,
-             self.baseline2,
-             self.noiseSigma2] = cfd.HitFinder(p=self.data2,
-                                               noiseSigmaInVolt=self.noiseSigmaInVolt,
-                                               cfdThreshold=self.cfdThreshold,
-                                               nNoiseSigmaThreshold=self.nNoiseSigmaThreshold)
-
-        ax = self.figure.add_subplot(211)
-        if self.showHitLines:
-            for x in self.hitStartIndexList1:
-                aHitLines = ax.axvline(x=x * self.dt, color='#F6553C')
-                txt = ax.text(x * self.dt - 1, self.offset + 1200, "{0:.1f} ns".format(x * self.dt),
-                              rotation=90,
-                              size=18,
-                              horizontalalignment='right',
-                              verticalalignment='top',
-                              multialignment='center',
-                              color='#F6553C')
-                self.hitLines1.append(aHitLines)
-                self.hitLines1.append(txt)
-        else:
-            for aHitLine in self.hitLines1:
-                aHitLine.remove()
-            self.hitLines1 = list()
-
-        ax = self.figure.add_subplot(212)
-        if self.showHitLines:
-            for x in self.hitStartIndexList2:
-                aHitLines = ax.axvline(x=x * self.dt, color='#F6553C')
-                txt = ax.text(x * self.dt - 1, self.offset + 1200, "{0:.1f} ns".format(x * self.dt),
-                              rotation=90,
-                              size=18,
-                              horizontalalignment='right',
-                              verticalalignment='top',
-                              multialignment='center',
-                              color='#F6553C')
-                self.hitLines2.append(aHitLines)
-                self.hitLines2.append(txt)
-        else:
-            for aHitLine in self.hitLines2:
-                aHitLine.remove()
-            self.hitLines2 = list()
-
-        self.draw()
-        self.foundHits = True
+    def drawHitLines(self):
+        self.setOverlay('hitLines', range(2) if self.showHitLines else [])
+        self.blitOverlays()
 
     def showTOF(self):
         self.showToFRegions = not self.showToFRegions
 
         if not self.foundHits:
             self.findHits()
+        self.withHits(self.drawTOF)
 
-        self.matchedHitList = tm.TimeMatching(hitListUpstream=self.hitStartIndexList1 * self.dt,
-                                              hitListDownstream=self.hitStartIndexList2 * self.dt,
-                                              coincidenceWindowLowerLim=self.coincidenceWindowLowerLim,
-                                              coincidenceWindowUpperLim=self.coincidenceWindowUpperLim)
-
-        ax = self.figure.add_subplot(211)
-        if self.showToFRegions:
-            for j in range(0, np.shape(self.matchedHitList)[0]):
-                if self.matchedHitList[j, 0] == 0 and self.matchedHitList[j, 1] == 0:
-                    continue
-                x1 = self.matchedHitList[j, 0]
-                x2 = self.matchedHitList[j, 1]
-                aToFRegion = ax.fill_betweenx(y=range(self.offset, self.offset + 2 ** self.nBits),
-                                              x1=x1,
-                                              x2=x2,
-                                              facecolor='#37A055',
-                                              alpha=0.5)
-                self.ToFRegion1.append(aToFRegion)
-        else:
-            for aToFRegion in self.ToFRegion1:
-                aToFRegion.remove()
-            self.ToFRegion1 = list()
-
-        ax = self.figure.add_subplot(212)
-        if self.showToFRegions:
-            for j in range(0, np.shape(self.matchedHitList)[0]):
-                if self.matchedHitList[j, 0] == 0 and self.matchedHitList[j, 1] == 0:
-                    continue
-                x1 = self.matchedHitList[j, 0]
-                x2 = self.matchedHitList[j, 1]
-                aToFRegion = ax.fill_betweenx(y=range(self.offset, self.offset + 2 ** self.nBits),
-                                              x1=x1,
-                                              x2=x2,
-                                              facecolor='#37A055',
-                                              alpha=0.5)
-                self.ToFRegion2.append(aToFRegion)
-        else:
-            for aToFRegion in self.ToFRegion2:
-                aToFRegion.remove()
-            self.ToFRegion2 = list()
-
-        self.draw()
+    def drawTOF(self):
+        self.setOverlay('tof', range(2) if self.showToFRegions else [])
+        self.blitOverlays()
 
     def togglePedestal(self):
         self.showPedestal = not self.showPedestal
+        self.withHits(self.drawPedestal)
 
-        if not self.foundHits:
-            self.showHitLines = not self.showHitLines
-            self.findHits()
-
-        ax = self.figure.add_subplot(211)
-        if self.showPedestal:
-            pedLine = ax.axhline(self.baseline1, color='#F36E19')
-            noiseBand1 = ax.fill_between(x=np.arange(0, self.nsamples * self.dt, self.dt),
-                                         y1=self.baseline1 - self.noiseSigma1,
-                                         y2=self.baseline1 + self.noiseSigma1,
-                                         facecolor='#F36E19',
-                                         alpha=0.7)
-            txt = ax.text(5, self.baseline1 + 200, "Baseline and Noise-band",
-                          rotation=0,
-                          size=18,
-                          horizontalalignment='left',
-                          verticalalignment='bottom',
-                          multialignment='center',
-                          color='#F36E19')
-            self.pedestalLines1.append(pedLine)
-            self.pedestalLines1.append(noiseBand1)
-            self.pedestalLines1.append(txt)
-        else:
-            for lines in self.pedestalLines1:
-                lines.remove()
-            self.pedestalLines1 = list()
-
-        ax = self.figure.add_subplot(212)
-        if self.showPedestal:
-            pedLine = ax.axhline(self.baseline2, color='#F36E19')
-            noiseBand2 = ax.fill_between(x=np.arange(0, self.nsamples * self.dt, self.dt),
-                                         y1=self.baseline2 - self.noiseSigma2,
-                                         y2=self.baseline2 + self.noiseSigma2,
-                                         facecolor='#F36E19',
-                                         alpha=0.7)
-            txt = ax.text(5, self.baseline2 + 200, "Baseline and Noise-band",
-                          rotation=0,
-                          size=18,
-                          horizontalalignment='left',
-                          verticalalignment='bottom',
-                          multialignment='center',
-                          color='#F36E19')
-            self.pedestalLines2.append(pedLine)
-            self.pedestalLines2.append(noiseBand2)
-            self.pedestalLines2.append(txt)
-        else:
-            for lines in self.pedestalLines2:
-                lines.remove()
-            self.pedestalLines2 = list()
-
-        self.draw()
+    def drawPedestal(self):
+        self.setOverlay('pedestal', range(2) if self.showPedestal else [])
+        self.blitOverlays()
 
     def toggleHitThreshold(self):
         self.showHitThreshold = not self.showHitThreshold
+        self.withHits(self.drawHitThreshold)
 
-        if not self.foundHits:
-            self.showHitLines = not self.showHitLines
-            self.findHits()
-
-        ax = self.figure.add_subplot(211)
-        if self.showHitThreshold:
-            hitLogicFunction = self.hitLogic1 * 100000 - 50000
-            hitLogicLines, = ax.plot(self.t1, hitLogicFunction, color='#2A2A2A')
-            hitThresholdLine = ax.axhline(self.baseline1 - self.nNoiseSigmaThreshold * self.noiseSigma1,
-                                          color='#2A2A2A')
-            self.hitThresholdLine1.append(hitThresholdLine)
-            self.hitThresholdLine1.append(hitLogicLines)
-        else:
-            for lines in self.hitThresholdLine1:
-                lines.remove()
-            self.hitThresholdLine1 = list()
-
-        ax = self.figure.add_subplot(212)
-        if self.showHitThreshold:
-            hitLogicFunction = self.hitLogic2 * 100000 - 50000
-            hitLogicLines, = ax.plot(self.t2, hitLogicFunction, color='#2A2A2A')
-            hitThresholdLine = ax.axhline(self.baseline2 - self.nNoiseSigmaThreshold * self.noiseSigma2,
-                                          color='#2A2A2A')
-            self.hitThresholdLine2.append(hitThresholdLine)
-            self.hitThresholdLine2.append(hitLogicLines)
-        else:
-            for lines in self.hitThresholdLine2:
-                lines.remove()
-            self.hitThresholdLine2 = list()
-
-        self.draw()
+    def drawHitThreshold(self):
+        self.setOverlay('hitThreshold', range(2) if self.showHitThreshold else [])
+        self.blitOverlays()
 
     def toggleCFDThreshold(self):
         self.nCFDThresholdClicks = self.nCFDThresholdClicks + 1
+        self.withHits(self.drawCFDThreshold)
 
-        if not self.foundHits:
-            self.showHitLines = not self.showHitLines
-            self.findHits()
-
+    def drawCFDThreshold(self):
+        # Each click steps to the next hit, upstream then downstream, and one past the last hides them again.
         nHitsUpstream = np.size(self.hitPeakAmplitude1)
         nHitsDownstream = np.size(self.hitPeakAmplitude2)
         if (self.nCFDThresholdClicks > (nHitsUpstream + nHitsDownstream)):
             self.nCFDThresholdClicks = 0
-            self.showCFDThreshold = False
-            for lines in self.cfdThresholdLine:
-                lines.remove()
-            self.cfdThresholdLine = list()
-        else:
-            self.showCFDThreshold = True
-            if (self.nCFDThresholdClicks <= nHitsUpstream):
-                for lines in self.cfdThresholdLine:
-                    lines.remove()
-                self.cfdThresholdLine = list()
-
-                ax = self.figure.add_subplot(211)
-                baseline = ax.axhline(self.baseline1, color='#13874B')
-                peakline = ax.axhline(self.hitPeakAmplitude1[self.nCFDThresholdClicks - 1], color='#13874B')
-                amplitude = self.baseline1 - self.hitPeakAmplitude1[self.nCFDThresholdClicks - 1]
-                threshold = self.baseline1 - self.cfdThreshold * amplitude
-                thrshline = ax.axhline(threshold, color='#13874B')
-                peakDot, = ax.plot(self.hitPeakIndex1[self.nCFDThresholdClicks - 1] * self.dt,
-                                   self.hitPeakAmplitude1[self.nCFDThresholdClicks - 1],
-                                   'o',
-                                   color='#13874B')
-                intersecDot, = ax.plot(self.hitStartIndexList1[self.nCFDThresholdClicks - 1] * self.dt,
-                                       threshold,
-                                       'o',
-                                       color='#13874B')
-                txt = ax.text(self.hitStartIndexList1[self.nCFDThresholdClicks - 1] * self.dt - 15,
-                              threshold - 240,
-                              "{0:.1f}%".format(self.cfdThreshold * 100),
-                              rotation=0,
-                              size=14,
-                              horizontalalignment='left',
-                              verticalalignment='bottom',
-                              multialignment='center',
-                              color='#13874B')
-                self.cfdThresholdLine.append(baseline)
-                self.cfdThresholdLine.append(peakline)
-                self.cfdThresholdLine.append(thrshline)
-                self.cfdThresholdLine.append(peakDot)
-                self.cfdThresholdLine.append(intersecDot)
-                self.cfdThresholdLine.append(txt)
-            if (self.nCFDThresholdClicks > nHitsUpstream) and (
-                    self.nCFDThresholdClicks <= nHitsUpstream + nHitsDownstream):
-                for lines in self.cfdThresholdLine:
-                    lines.remove()
-                self.cfdThresholdLine = list()
-
-                ax = self.figure.add_subplot(212)
-                baseline = ax.axhline(self.baseline2, color='#13874B')
-                peakline = ax.axhline(self.hitPeakAmplitude2[self.nCFDThresholdClicks - 1 - nHitsUpstream],
-                                      color='#13874B')
-                amplitude = self.baseline2 - self.hitPeakAmplitude2[self.nCFDThresholdClicks - 1 - nHitsUpstream]
-                threshold = self.baseline2 - self.cfdThreshold * amplitude
-                thrshline = ax.axhline(threshold, color='#13874B')
-                peakDot, = ax.plot(self.hitPeakIndex2[self.nCFDThresholdClicks - 1 - nHitsUpstream] * self.dt,
-                                   self.hitPeakAmplitude2[self.nCFDThresholdClicks - 1 - nHitsUpstream],
-                                   'o',
-                                   color='#13874B')
-                intersecDot, = ax.plot(self.hitStartIndexList2[self.nCFDThresholdClicks - 1 - nHitsUpstream] * self.dt,
-                                       threshold,
-                                       'o',
-                                       color='#13874B')
-                txt = ax.text(self.hitStartIndexList2[self.nCFDThresholdClicks - 1 - nHitsUpstream] * self.dt - 15,
-                              threshold - 240,
-                              "{0:.1f}%".format(self.cfdThreshold * 100),
-                              rotation=0,
-                              size=14,
-                              horizontalalignment='left',
-                              verticalalignment='bottom',
-                              multialignment='center',
-                              color='#13874B')
-                self.cfdThresholdLine.append(baseline)
-                self.cfdThresholdLine.append(peakline)
-                self.cfdThresholdLine.append(thrshline)
-                self.cfdThresholdLine.append(peakDot)
-                self.cfdThresholdLine.append(intersecDot)
-                self.cfdThresholdLine.append(txt)
-
-        self.draw()
+        self.showCFDThreshold = self.nCFDThresholdClicks > 0
+        self.setOverlay('cfdThreshold', [self.nCFDThresholdClicks - 1] if self.showCFDThreshold else [])
+        self.blitOverlays()
 
     def toggleCoincidenceWindow(self):
         self.nToggleCoincidenceWindowClicks = self.nToggleCoincidenceWindowClicks + 1
+        self.withHits(self.drawCoincidenceWindow)
 
-        if not self.foundHits:
-            self.showHitLines = not self.showHitLines
-            self.findHits()
-
+    def drawCoincidenceWindow(self):
         nHitsUpstream = np.size(self.hitStartIndexList1)
         if (self.nToggleCoincidenceWindowClicks > nHitsUpstream):
             self.nToggleCoincidenceWindowClicks = 0
-            for regions in self.coincidenceWindowRegions:
-                regions.remove()
-            self.coincidenceWindowRegions = list()
-        else:
-            for regions in self.coincidenceWindowRegions:
-                regions.remove()
-            self.coincidenceWindowRegions = list()
-
-            ax = self.figure.add_subplot(212)
-            x1 = self.hitStartIndexList1[
-                     self.nToggleCoincidenceWindowClicks - 1] * self.dt + self.coincidenceWindowLowerLim
-            x2 = self.hitStartIndexList1[
-                     self.nToggleCoincidenceWindowClicks - 1] * self.dt + self.coincidenceWindowUpperLim
-            if x2 > self.nsamples * self.dt:
-                x2 = self.nsamples * self.dt
-            tofusLineDashed = ax.axvline(x=self.hitStartIndexList1[self.nToggleCoincidenceWindowClicks - 1] * self.dt,
-                                         color='#EA4335', linestyle='--')
-            aToFRegion = ax.fill_betweenx(y=range(self.offset, self.offset + 2 ** self.nBits),
-                                          x1=x1,
-                                          x2=x2,
-                                          facecolor='#EA4335',
-                                          alpha=0.5)
-            txtLower = ax.text(x1 - 4,
-                          self.offset + 200,
-                          "t0 + {0:.1f} ns".format(self.coincidenceWindowLowerLim),
-                          rotation=90,
-                          size=14,
-                          horizontalalignment='left',
-                          verticalalignment='bottom',
-                          multialignment='center',
-                          color='#EA4335')
-
-            txtUpper = ax.text(x2 - 4,
-                          self.offset + 200,
-                          "t0 + {0:.1f} ns".format(self.coincidenceWindowUpperLim),
-                          rotation=90,
-                          size=14,
-                          horizontalalignment='left',
-                          verticalalignment='bottom',
-                          multialignment='center',
-                          color='#EA4335')
-            self.coincidenceWindowRegions.append(tofusLineDashed)
-            self.coincidenceWindowRegions.append(aToFRegion)
-            self.coincidenceWindowRegions.append(txtLower)
-            self.coincidenceWindowRegions.append(txtUpper)
-
-            ax = self.figure.add_subplot(211)
-            tofusLine = ax.axvline(x=self.hitStartIndexList1[self.nToggleCoincidenceWindowClicks - 1] * self.dt,
-                                   color='#EA4335')
-            tofIndicator = ax.text(self.hitStartIndexList1[self.nToggleCoincidenceWindowClicks - 1] * self.dt - 1,
-                                   self.offset + 1200,
-                                   "{0:.1f} ns".format(self.hitStartIndexList1[self.nToggleCoincidenceWindowClicks - 1] * self.dt),
-                                   rotation=90,
-                                   size=18,
-                                   horizontalalignment='right',
-                                   verticalalignment='top',
-                                   multialignment='center',
-                                   color='#F6553C')
-            self.coincidenceWindowRegions.append(tofusLine)
-            self.coincidenceWindowRegions.append(tofIndicator)
-
-        self.draw()
+        self.setOverlay('coincidenceWindow',
+                        [self.nToggleCoincidenceWindowClicks - 1] if self.nToggleCoincidenceWindowClicks > 0 else [])
+        self.blitOverlays()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+import numpy as np
+
+# Level-of-detail view of one long waveform for plotting. Level k holds the minimum and maximum of consecutive
+# blocks of factor**k samples, so any time range can be drawn with a couple of points per pixel: an envelope of
+# block minima and maxima while the range is wide, the raw samples once they are no denser than the pixels.
+
+
+class MinMaxPyramid:
+
+    def __init__(self, t, p, factor=4, minBlocks=64):
+        self.t = np.asarray(t, dtype=float)
+        self.p = np.asarray(p)
+        self.dt = self.t[1] - self.t[0] if np.size(self.t) > 1 else 1.
+        self.levels = []
+
+        [mins, maxs] = [self.p, self.p]
+        blockSize = 1
+        while np.size(mins) > minBlocks:
+            # Padding with the last value leaves every block's extremes unchanged.
+            nBlocks = -(-np.size(mins) // factor)
+            pad = nBlocks * factor - np.size(mins)
+            mins = np.pad(mins, (0, pad), mode='edge').reshape(nBlocks, factor).min(axis=1)
+            maxs = np.pad(maxs, (0, pad), mode='edge').reshape(nBlocks, factor).max(axis=1)
+            blockSize = blockSize * factor
+            self.levels.append([blockSize, mins, maxs])
+
+    def select(self, tMin, tMax, nPixels):
+        # Returns [t, p] covering [tMin, tMax] from the coarsest level that still has a block per pixel. Blocks
+        # are drawn as their minimum and maximum at the block centre, which the line joins into the envelope.
+        first = max(int(np.searchsorted(self.t, tMin, side='right')) - 1, 0)
+        last = min(int(np.searchsorted(self.t, tMax, side='left')) + 1, np.size(self.t))
+        samplesPerPixel = (last - first) / max(nPixels, 1)
+        usable = [aLevel for aLevel in self.levels if aLevel[0] <= samplesPerPixel]
+        if samplesPerPixel <= 2 or not usable:
+            return [self.t[first:last], self.p[first:last]]
+
+        [blockSize, mins, maxs] = usable[-1]
+        blocks = np.arange(first // blockSize, -(-last // blockSize))
+        centres = self.t[0] + (blocks * blockSize + (blockSize - 1) / 2) * self.dt
+        return [np.repeat(centres, 2), np.column_stack((mins[blocks], maxs[blocks])).ravel()]
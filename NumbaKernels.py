@@ -0,0 +1,196 @@
+import threading
+
+import numpy as np
+
+# Compiled kernels for the hit finder. Numba is optional: without it available is False and callers stay on
+# the NumPy implementations in CFDHitFinder.
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+available = njit is not None
+
+
+def jit(function):
+    return njit(parallel=True, cache=True)(function) if available else function
+
+
+def serialJit(function):
+    # For kernels whose iterations depend on each other, where parallel=True would only warn.
+    return njit(cache=True)(function) if available else function
+
+
+@jit
+def launchThreads(n):
+    total = 0
+    for i in prange(n):
+        total += i
+    return total
+
+
+def startThreads():
+    # Numba's default workqueue pool hangs at interpreter exit if it is first launched from a worker thread,
+    # so threaded callers start it from the main thread before handing work out. It must not be started in a
+    # process that later forks workers, which is why this is not done on import.
+    if available and threading.current_thread() is threading.main_thread():
+        launchThreads(2)
+
+
+@jit
+def discriminate(p, threshold, smoothing, logic, starts, stops, nRuns):
+    # Event by event: smooth with the Savitzky-Golay rows (edge rows fit the first/last window like scipy's
+    # 'interp' mode), then compare against the event threshold and record run edges while the row is in cache.
+    [nEvents, nsamples] = p.shape
+    window = smoothing.shape[1]
+    half = window // 2
+    kernel = smoothing[half]
+    for row in prange(nEvents):
+        x = p[row]
+        value = np.empty(nsamples)
+        for i in range(half, nsamples - half):
+            total = 0.
+            for k in range(window):
+                total += kernel[k] * x[i - half + k]
+            value[i] = total
+        for i in range(half):
+            head = 0.
+            tail = 0.
+            for k in range(window):
+                head += smoothing[i, k] * x[k]
+                tail += smoothing[half + 1 + i, k] * x[nsamples - window + k]
+            value[i] = head
+            value[nsamples - half + i] = tail
+
+        n = 0
+        inRun = False
+        for i in range(nsamples):
+            below = value[i] < threshold[row]
+            logic[row, i] = below
+            if below and not inRun:
+                starts[row, n] = i
+            elif inRun and not below:
+                stops[row, n] = i
+                n += 1
+            inRun = below
+        if inRun:
+            stops[row, n] = nsamples
+            n += 1
+        nRuns[row] = n
+
+
+def discriminateBatch(p, threshold, smoothing):
+    p = np.ascontiguousarray(p, dtype=np.float64)
+    [nEvents, nsamples] = np.shape(p)
+    maxRuns = nsamples // 2 + 1
+    logic = np.empty((nEvents, nsamples), dtype=np.bool_)
+    starts = np.empty((nEvents, maxRuns), dtype=np.int64)
+    stops = np.empty((nEvents, maxRuns), dtype=np.int64)
+    nRuns = np.empty(nEvents, dtype=np.int64)
+    discriminate(p, np.ascontiguousarray(threshold, dtype=np.float64), smoothing, logic, starts, stops, nRuns)
+
+    [rows, slots] = np.nonzero(np.arange(maxRuns) < nRuns[:, None])
+    return [logic, [rows, starts[rows, slots], stops[rows, slots]]]
+
+
+@jit
+def findPeaks(p, rows, starts, stops, peakIndex, peakAmplitude):
+    # Pulse by pulse: first minimum in [start, stop).
+    for pulse in prange(rows.size):
+        row = rows[pulse]
+        peak = starts[pulse]
+        for i in range(starts[pulse] + 1, stops[pulse]):
+            if p[row, i] < p[row, peak]:
+                peak = i
+        peakIndex[pulse] = peak
+        peakAmplitude[pulse] = p[row, peak]
+
+
+def findPeaksBatch(p, rows, starts, stops):
+    n = np.size(rows)
+    [peakIndex, peakAmplitude] = [np.zeros(n, dtype=np.int64), np.empty(n)]
+    findPeaks(np.ascontiguousarray(p, dtype=np.float64), rows.astype(np.int64), starts.astype(np.int64),
+              stops.astype(np.int64), peakIndex, peakAmplitude)
+    return [peakIndex, peakAmplitude]
+
+
+@jit
+def scanCrossings(p, rows, peakIndex, threshold, crossingIndex, crossed):
+    # Pulse by pulse: backward scan from the peak for p[j] <= threshold < p[j - 1].
+    for pulse in prange(rows.size):
+        row = rows[pulse]
+        crossed[pulse] = False
+        for j in range(peakIndex[pulse], 0, -1):
+            if p[row, j] <= threshold[pulse] and p[row, j - 1] > threshold[pulse]:
+                crossingIndex[pulse] = j
+                crossed[pulse] = True
+                break
+
+
+def scanCrossingsBatch(p, rows, peakIndex, threshold):
+    n = np.size(rows)
+    crossingIndex = np.zeros(n, dtype=np.int64)
+    crossed = np.empty(n, dtype=np.bool_)
+    scanCrossings(np.ascontiguousarray(p, dtype=np.float64), rows.astype(np.int64), peakIndex.astype(np.int64),
+                  np.ascontiguousarray(threshold, dtype=np.float64), crossingIndex, crossed)
+    return [crossingIndex, crossed]
+
+
+@serialJit
+def runningPedestal(codes, histogram, decay, m, offset, baseline, mad):
+    # Event by event, as RunningPedestal.estimate over every code: decay and fill the histogram, then median,
+    # MAD by bisection on the cumulative weight, and the mean of the codes strictly within m MADs.
+    nCodes = histogram.size
+    cumulative = np.empty(nCodes)
+    for i in range(codes.shape[0]):
+        for k in range(nCodes):
+            histogram[k] *= decay
+        for j in range(codes.shape[1]):
+            histogram[codes[i, j]] += 1.
+        total = 0.
+        for k in range(nCodes):
+            total += histogram[k]
+            cumulative[k] = total
+        half = 0.5 * total
+        median = 0
+        while median < nCodes and cumulative[median] < half:
+            median += 1
+
+        lower = 0
+        upper = nCodes
+        while lower < upper:
+            middle = (lower + upper) // 2
+            within = cumulative[min(median + middle, nCodes - 1)]
+            if median - middle - 1 >= 0:
+                within -= cumulative[median - middle - 1]
+            if within >= half:
+                upper = middle
+            else:
+                lower = middle + 1
+        mad[i] = lower
+
+        first = 0
+        last = nCodes
+        if lower > 0:
+            reach = int(np.ceil(m * lower)) - 1
+            first = max(median - reach, 0)
+            last = min(median + reach + 1, nCodes)
+        weight = 0.
+        weighted = 0.
+        for k in range(first, last):
+            weight += histogram[k]
+            weighted += histogram[k] * (k + offset)
+        baseline[i] = weighted / weight
+    return median
+
+
+def runningPedestalBatch(codes, histogram, decay, m, offset):
+    # Updates histogram in place; returns [baseline, mad] per event and the last event's median code index.
+    nEvents = np.shape(codes)[0]
+    [baseline, mad] = [np.empty(nEvents), np.zeros(nEvents, dtype=np.int64)]
+    median = runningPedestal(np.ascontiguousarray(codes, dtype=np.int64), histogram, float(decay), float(m),
+                             float(offset), baseline, mad)
+    return [baseline, mad, median]
+
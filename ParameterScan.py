@@ -0,0 +1,289 @@
+import argparse
+import inspect
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+
+import numpy as np
+
+import Benchmark as bench
+import CFDHitFinder as cfd
+import Production as prod
+import Profiling as prof
+import Reconstruction as reco
+import TimeMatcher as tm
+import WaveformIO as wio
+
+# ToF resolution and efficiency over a grid of reconstruction parameters. Grid points that differ only in the
+# CFD fraction or the coincidence window share everything before that: each worker discriminates an event chunk
+# once per group, runs the crossing search once per fraction and matches once with the widest window, which every
+# narrower window is then cut from. Jobs are (group, event chunk) pairs spread over a process pool, and their
+# per-point moments are merged at the end. Simulated scans produce the events once into a temporary run.
+# Production draws the two channels' hits independently, so on simulated runs the ToF spread is that of a flat
+# distribution over the coincidence window and the resolution column only ranks window widths. Those reports are
+# flagged and carry simulatedWarning, and tof-scan marks no best point.
+
+scanFormat = 'tof-scan'
+scanVersion = 2
+
+sharedParameters = ('cfdThreshold', 'coincidenceWindowLowerLim', 'coincidenceWindowUpperLim')
+truthColumns = ['nhitsUpstream', 'nhitsDownstream']
+# Production stores its config with a run, which no other source of waveforms has.
+simulationAttribute = 'speAmplitude'
+simulatedWarning = ('simulated channels are uncorrelated: resolution is about (upper - lower) / sqrt(12) of the '
+                    'coincidence window and does not measure the reconstruction')
+
+# Reconstruction smooths with HitFinderBatch's default polynomial order, which bounds the usable sgWindow values.
+sgPolyOrder = inspect.signature(cfd.HitFinderBatch).parameters['sgPolyOrder'].default
+
+
+def makeGrid(grid, config):
+    # Returns one full reconstruction config per point of the cartesian product of grid's values.
+    unknown = [name for name in grid if name not in reco.defaultRecoConfig]
+    if unknown:
+        raise ValueError('Unknown scan parameter {0}, choose from {1}'.format(unknown, list(reco.defaultRecoConfig)))
+    return [dict(config, **dict(zip(grid, values))) for values in itertools.product(*grid.values())]
+
+
+def groupPoints(points):
+    # [[pointIndex, config], ...] split into lists that agree on everything but the shared parameters.
+    groups = {}
+    for index, config in enumerate(points):
+        key = tuple(sorted((name, value) for name, value in config.items() if name not in sharedParameters))
+        groups.setdefault(key, []).append([index, config])
+    return list(groups.values())
+
+
+def emptyStats():
+    return {'nEvents': 0, 'nEligible': 0, 'nMatchedEvents': 0, 'nPairs': 0, 'meanToF': 0., 'm2ToF': 0.,
+            'nHits': [0, 0], 'nTrueHits': [0, 0]}
+
+
+def mergeStats(a, b):
+    # Chan et al.'s pairwise update, so chunk moments combine without a sum of squares losing the variance.
+    nPairs = a['nPairs'] + b['nPairs']
+    delta = b['meanToF'] - a['meanToF']
+    merged = {name: a[name] + b[name] for name in ['nEvents', 'nEligible', 'nMatchedEvents', 'nPairs']}
+    merged['meanToF'] = a['meanToF'] + delta * b['nPairs'] / nPairs if nPairs else 0.
+    merged['m2ToF'] = a['m2ToF'] + b['m2ToF'] + (delta ** 2 * a['nPairs'] * b['nPairs'] / nPairs if nPairs else 0.)
+    merged['nHits'] = [x + y for x, y in zip(a['nHits'], b['nHits'])]
+    merged['nTrueHits'] = [x + y for x, y in zip(a['nTrueHits'], b['nTrueHits'])]
+    return merged
+
+
+def scanEvents(columns, firstEvent, group, pedestals=None):
+    # Returns {pointIndex: stats} for one event chunk and one group of points from groupPoints.
+    config = group[0][1]
+    nEvents = np.shape(columns[reco.channelColumns[0]])[0]
+    thresholds = sorted(set(aConfig['cfdThreshold'] for index, aConfig in group))
+    if all(name in columns for name in truthColumns):
+        nTrueHits = [int(np.sum(columns[name])) for name in truthColumns]
+        eligible = (np.asarray(columns[truthColumns[0]]) > 0) & (np.asarray(columns[truthColumns[1]]) > 0)
+    else:
+        [nTrueHits, eligible] = [[0, 0], np.ones(nEvents, dtype=bool)]
+
+    pedestals = pedestals or reco.makePedestals(config)
+    hits = [cfd.HitFinderCFDScan(p=columns[name],
+                                 noiseSigmaInVolt=config['noiseSigmaInVolt'],
+                                 cfdThresholds=thresholds,
+                                 nNoiseSigmaThreshold=config['nNoiseSigmaThreshold'],
+                                 sgWindow=config['sgWindow'],
+                                 cfdInterpolation=config['cfdInterpolation'],
+                                 channel=channel,
+                                 firstEvent=firstEvent,
+                                 dt=config['dt'],
+                                 nBits=config['nBits'],
+                                 dynamicRange=config['dynamicRange'],
+                                 pedestal=pedestals[channel]) for channel, name in enumerate(reco.channelColumns)]
+
+    lower = min(aConfig['coincidenceWindowLowerLim'] for index, aConfig in group)
+    upper = max(aConfig['coincidenceWindowUpperLim'] for index, aConfig in group)
+    stats = {}
+    for iThreshold, aThreshold in enumerate(thresholds):
+        [upstream, downstream] = [hits[0][iThreshold], hits[1][iThreshold]]
+        with prof.stage('matching', nEvents):
+            [matchedHitList, matchedEvent] = tm.TimeMatchingBatch(
+                hitListUpstream=upstream['cfdTime'],
+                hitListDownstream=downstream['cfdTime'],
+                coincidenceWindowLowerLim=lower,
+                coincidenceWindowUpperLim=upper,
+                eventUpstream=upstream['event'],
+                eventDownstream=downstream['event'])
+        timeDiff = matchedHitList[:, 1] - matchedHitList[:, 0]
+
+        for index, aConfig in group:
+            if aConfig['cfdThreshold'] != aThreshold:
+                continue
+            # The same window test TimeMatchingBatch applies, so the cut reproduces a match with this window.
+            inWindow = (timeDiff - aConfig['coincidenceWindowLowerLim'] >= 0) & \
+                       (timeDiff - aConfig['coincidenceWindowUpperLim'] <= 0)
+            tof = timeDiff[inWindow]
+            events = np.unique(matchedEvent[inWindow]) - firstEvent
+            stats[index] = {'nEvents': nEvents,
+                            'nEligible': int(np.count_nonzero(eligible)),
+                            'nMatchedEvents': int(np.count_nonzero(eligible[events])),
+                            'nPairs': int(np.size(tof)),
+                            'meanToF': float(np.mean(tof)) if np.size(tof) else 0.,
+                            'm2ToF': float(np.sum((tof - np.mean(tof)) ** 2)) if np.size(tof) else 0.,
+                            'nHits': [int(np.size(upstream)), int(np.size(downstream))],
+                            'nTrueHits': nTrueHits}
+    return stats
+
+
+def scanRange(path, start, stop, group, columns, windowSize=None):
+    # Read window by window like reco.reconstructRange, with one set of pedestals for the whole range.
+    windowSize = windowSize or stop - start
+    pedestals = reco.makePedestals(group[0][1])
+    merged = {}
+    with wio.openReader(path) as reader:
+        for windowStart in range(start, stop, windowSize):
+            windowStop = min(windowStart + windowSize, stop)
+            with prof.stage('read', windowStop - windowStart):
+                data = reader.readEvents(windowStart, windowStop, columns=columns)
+            for index, stats in scanEvents(data, windowStart, group, pedestals=pedestals).items():
+                merged[index] = mergeStats(merged.get(index, emptyStats()), stats)
+    return merged
+
+
+def summarize(stats, parameters):
+    return {'parameters': parameters,
+            'nEvents': stats['nEvents'],
+            'nPairs': stats['nPairs'],
+            'meanToF': stats['meanToF'] if stats['nPairs'] else None,
+            'resolution': float(np.sqrt(stats['m2ToF'] / (stats['nPairs'] - 1))) if stats['nPairs'] > 1 else None,
+            'efficiency': stats['nMatchedEvents'] / stats['nEligible'] if stats['nEligible'] else None,
+            'nHits': stats['nHits'],
+            'hitRatio': [found / true if true else None for found, true in zip(stats['nHits'], stats['nTrueHits'])]}
+
+
+def scanRun(path, grid, nWorkers=None, chunkSize=1000, nEvents=None, config=None):
+    with wio.openReader(path) as reader:
+        nEvents = reader.nEvents if nEvents is None else min(nEvents, reader.nEvents)
+        attributes = getattr(reader, 'attributes', {})
+        baseConfig = reco.runRecoConfig(reader, config)
+        columns = reco.channelColumns + [name for name in truthColumns if name in reader.columns]
+    points = makeGrid(grid, baseConfig)
+
+    groups = groupPoints(points)
+    jobs = [(path, start, stop, group, columns, chunkSize)
+            for group in groups for [start, stop] in reco.jobRanges(nEvents, chunkSize, group[0][1])]
+    results = []
+    if jobs:
+        with get_context('spawn').Pool(nWorkers) as pool:
+            results = prof.mapProfiled(pool, scanRange, jobs)
+
+    merged = [emptyStats() for aPoint in points]
+    for aResult in results:
+        for index, stats in aResult.items():
+            merged[index] = mergeStats(merged[index], stats)
+    return {'config': baseConfig,
+            'nEvents': nEvents,
+            'truth': len(columns) > len(reco.channelColumns),
+            'simulated': simulationAttribute in attributes,
+            'warning': simulatedWarning if simulationAttribute in attributes else None,
+            'results': [summarize(stats, {name: aPoint[name] for name in grid})
+                        for stats, aPoint in zip(merged, points)]}
+
+
+def scanParameters(grid, path=None, nEvents=None, nWorkers=None, chunkSize=1000, seed=None, config=None,
+                   simConfig=None):
+    # grid maps reconstruction parameter names to the values to scan. Without a path, nEvents (default 2000)
+    # are simulated with simConfig first; the seed they were simulated with is reported.
+    report = {'format': scanFormat,
+              'version': scanVersion,
+              'commit': bench.gitCommit(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'input': path,
+              'seed': None,
+              'grid': {name: list(values) for name, values in grid.items()}}
+    if path is not None:
+        report.update(scanRun(path, grid, nWorkers=nWorkers, chunkSize=chunkSize, nEvents=nEvents, config=config))
+        return report
+
+    nEvents = 2000 if nEvents is None else nEvents
+    with tempfile.TemporaryDirectory() as directory:
+        runPath = os.path.join(directory, 'scan')
+        # Uncompressed, so every job memory-maps just its own window.
+        report['seed'] = prod.produceEvents(nEvents, runPath, nWorkers=nWorkers, seed=seed, chunkSize=chunkSize,
+                                            config=simConfig, writerChunkSize=chunkSize, compression='none')
+        report.update(scanRun(runPath, grid, nWorkers=nWorkers, chunkSize=chunkSize, config=config))
+    return report
+
+
+def parseScan(text):
+    # name=v1,v2,... or name=first:last:n for n evenly spaced values.
+    [name, separator, values] = text.partition('=')
+    if name not in reco.defaultRecoConfig or not values:
+        raise argparse.ArgumentTypeError('expected name=v1,v2,... or name=first:last:n with name one of '
+                                         '{0}, got {1!r}'.format(list(reco.defaultRecoConfig), text))
+    valueType = type(reco.defaultRecoConfig[name])
+    try:
+        if values.count(':') == 2:
+            [first, last, n] = values.split(':')
+            values = np.linspace(float(first), float(last), int(n))
+            if valueType is int and np.any(values != np.round(values)):
+                raise ValueError('{0} takes integers, {1} gives {2}'.format(name, text, list(values)))
+        else:
+            values = values.split(',')
+        values = [valueType(aValue) for aValue in values]
+        if name == 'sgWindow':
+            for aValue in values:
+                cfd.CheckSavgolWindow(aValue, sgPolyOrder)
+        return [name, values]
+    except ValueError as error:
+        raise argparse.ArgumentTypeError('bad values for {0}: {1}'.format(name, error))
+
+
+def columnWidth(name):
+    return max(12, len(name) + 2)
+
+
+def formatPoint(result, names, best=False):
+    columns = ''.join('{0:>{1}}'.format('{0:g}'.format(result['parameters'][name])
+                                        if isinstance(result['parameters'][name], float)
+                                        else result['parameters'][name], columnWidth(name)) for name in names)
+    return '{0}{1:>12}{2:>12}{3:>12}{4:>10}{5}'.format(
+        columns,
+        '-' if result['resolution'] is None else '{0:.4f}'.format(result['resolution']),
+        '-' if result['meanToF'] is None else '{0:.3f}'.format(result['meanToF']),
+        '-' if result['efficiency'] is None else '{0:.4f}'.format(result['efficiency']),
+        result['nPairs'], '  *' if best else '')
+
+
+def scanMain(argv=None):
+    parser = argparse.ArgumentParser(prog='tof-scan', description='Scan reconstruction parameters and report the '
+                                                                   'ToF resolution and efficiency of each point.')
+    parser.add_argument('input', nargs='?', default=None, help='.root file or run directory, default: simulate')
+    parser.add_argument('--scan', type=parseScan, nargs='+', required=True, metavar='NAME=VALUES',
+                        help='v1,v2,... or first:last:n; a single value fixes a parameter')
+    parser.add_argument('-n', '--nevents', type=int, default=None, help='default: all events, or 2000 simulated')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='default: all cores')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='simulation seed')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='events per job')
+    parser.add_argument('-o', '--output', default='Scan.json')
+    args = parser.parse_args(argv)
+
+    grid = dict(args.scan)
+    report = scanParameters(grid, path=args.input, nEvents=args.nevents, nWorkers=args.workers,
+                            chunkSize=args.chunk_size, seed=args.seed)
+    resolutions = [aResult['resolution'] for aResult in report['results'] if aResult['resolution'] is not None]
+    best = min(resolutions) if resolutions and not report['simulated'] else None
+    if report['warning'] is not None:
+        print('Warning: {0}'.format(report['warning']), file=sys.stderr)
+
+    print(''.join('{0:>{1}}'.format(name, columnWidth(name)) for name in grid) +
+          '{0:>12}{1:>12}{2:>12}{3:>10}'.format('resolution', 'mean ToF', 'efficiency', 'pairs'))
+    for aResult in report['results']:
+        print(formatPoint(aResult, grid, best=best is not None and aResult['resolution'] == best))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('Wrote {0} points over {1} events to {2}'.format(len(report['results']), report['nEvents'], args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(scanMain())
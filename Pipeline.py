@@ -0,0 +1,260 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+import CFDHitFinder as cfd
+import NumbaKernels as nk
+import Production as prod
+import Profiling as prof
+import Reconstruction as reco
+import SiPMWaveGen as swg
+import TimeMatcher as tm
+import WaveformIO as wio
+
+# Stages run in their own threads and hand chunks downstream through bounded queues, so a slow stage (usually
+# the writer) blocks the ones before it instead of letting chunks pile up in memory.
+
+endOfStream = object()
+
+channels = ['Upstream', 'Downstream']
+
+tofColumns = {'tofEvent': wio.columnSpec(np.int64),
+              'tofUpstream': wio.columnSpec(np.float64),
+              'tofDownstream': wio.columnSpec(np.float64)}
+
+hitColumns = {name: wio.columnSpec(cfd.hitDtype[name]) for name in cfd.hitDtype.names}
+
+
+class Pipeline:
+
+    def __init__(self, source, stages, sink, queueSize=2, pollInterval=0.1):
+        self.source = source
+        self.stages = stages
+        self.sink = sink
+        self.queueSize = queueSize
+        self.pollInterval = pollInterval
+        self.stopped = threading.Event()
+        self.errors = []
+
+    def put(self, aQueue, item):
+        while not self.stopped.is_set():
+            try:
+                aQueue.put(item, timeout=self.pollInterval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, aQueue):
+        while not self.stopped.is_set():
+            try:
+                return aQueue.get(timeout=self.pollInterval)
+            except queue.Empty:
+                pass
+        return endOfStream
+
+    def fail(self, error):
+        self.errors.append(error)
+        self.stopped.set()
+
+    def feed(self, outQueue):
+        try:
+            for item in self.source:
+                if not self.put(outQueue, item):
+                    return
+            self.put(outQueue, endOfStream)
+        except Exception as error:
+            self.fail(error)
+
+    def process(self, function, inQueue, outQueue):
+        try:
+            while True:
+                item = self.get(inQueue)
+                if item is endOfStream:
+                    self.put(outQueue, endOfStream)
+                    return
+                if not self.put(outQueue, function(item)):
+                    return
+        except Exception as error:
+            self.fail(error)
+
+    def run(self):
+        nk.startThreads()
+        queues = [queue.Queue(self.queueSize) for i in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.feed, args=(queues[0],), name='source', daemon=True)]
+        for i, [name, function] in enumerate(self.stages):
+            threads.append(threading.Thread(target=self.process, args=(function, queues[i], queues[i + 1]),
+                                            name=name, daemon=True))
+        for aThread in threads:
+            aThread.start()
+
+        nChunks = 0
+        try:
+            while True:
+                item = self.get(queues[-1])
+                if item is endOfStream:
+                    break
+                self.sink(item)
+                nChunks = nChunks + 1
+        except BaseException as error:
+            self.fail(error)
+        finally:
+            self.stopped.set()
+            for aThread in threads:
+                aThread.join()
+
+        if self.errors:
+            raise self.errors[0]
+        return nChunks
+
+
+def generateChunks(nEvents, chunkSize, config, seed=None):
+    # nEvents=None keeps generating until the consumer stops the pipeline.
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, config['nsamples'] * config['dt'], config['dt'])
+    firstEvent = 0
+    while nEvents is None or firstEvent < nEvents:
+        n = chunkSize if nEvents is None else min(chunkSize, nEvents - firstEvent)
+        chunk = {'firstEvent': firstEvent, 'nEvents': n}
+        start = time.time_ns()
+        for channel in channels:
+            with prof.stage('generation', n):
+                [response, true_response, nhits] = swg.waveGenBatch(t, n,
+                                                                    speAmplitude=config['speAmplitude'],
+                                                                    noiseSigmaInVolt=config['noiseSigmaInVolt'],
+                                                                    riseTime=config['riseTime'],
+                                                                    fallTime=config['fallTime'],
+                                                                    rng=rng)
+            chunk['volt' + channel] = response
+            chunk['trueVolt' + channel] = true_response
+            chunk['nhits' + channel] = nhits
+        chunk['timestamp'] = prod.eventTimestamps(n, start, time.time_ns())
+        yield chunk
+        firstEvent = firstEvent + n
+
+
+def replayChunks(path, chunkSize, nEvents=None):
+    with wio.openReader(path) as reader:
+        for [firstEvent, columns] in reader.iterWindows(chunkSize, stop=nEvents):
+            columns.update(firstEvent=firstEvent, nEvents=np.shape(columns[reco.channelColumns[0]])[0])
+            yield columns
+
+
+def digitizeStage(config):
+    def digitize(chunk):
+        with prof.stage('digitization', chunk['nEvents']):
+            for channel in channels:
+                for [voltName, adcName] in [['volt' + channel, 'adc' + channel],
+                                            ['trueVolt' + channel, 'true' + channel]]:
+                    chunk[adcName] = np.empty(np.shape(chunk[voltName]), dtype=np.uint16)
+                    swg.digitizeWaveInto(chunk[voltName], chunk[adcName], nBits=config['nBits'],
+                                         voltMin=config['voltMin'], dynamicRange=config['dynamicRange'],
+                                         offset=config['offset'], work=chunk[voltName])
+                    del chunk[voltName]
+        return chunk
+    return digitize
+
+
+def hitFindStage(recoConfig):
+    pedestals = reco.makePedestals(recoConfig)
+
+    def hitFind(chunk):
+        chunk['hits'] = [cfd.HitFinderBatch(p=chunk[name],
+                                            noiseSigmaInVolt=recoConfig['noiseSigmaInVolt'],
+                                            cfdThreshold=recoConfig['cfdThreshold'],
+                                            nNoiseSigmaThreshold=recoConfig['nNoiseSigmaThreshold'],
+                                            sgWindow=recoConfig['sgWindow'],
+                                            cfdInterpolation=recoConfig['cfdInterpolation'],
+                                            channel=channel,
+                                            firstEvent=chunk['firstEvent'],
+                                            dt=recoConfig['dt'],
+                                            nBits=recoConfig['nBits'],
+                                            dynamicRange=recoConfig['dynamicRange'],
+                                            pedestal=pedestals[channel])
+                         for channel, name in enumerate(reco.channelColumns)]
+        return chunk
+    return hitFind
+
+
+def matchStage(recoConfig):
+    def match(chunk):
+        [hitsUpstream, hitsDownstream] = chunk['hits']
+        with prof.stage('matching', chunk['nEvents']):
+            [matchedHitList, matchedEvent] = tm.TimeMatchingBatch(
+                hitListUpstream=hitsUpstream['cfdTime'],
+                hitListDownstream=hitsDownstream['cfdTime'],
+                coincidenceWindowLowerLim=recoConfig['coincidenceWindowLowerLim'],
+                coincidenceWindowUpperLim=recoConfig['coincidenceWindowUpperLim'],
+                eventUpstream=hitsUpstream['event'],
+                eventDownstream=hitsDownstream['event'])
+        chunk['hits'] = np.concatenate(chunk['hits'])
+        chunk['tof'] = {'tofEvent': matchedEvent,
+                        'tofUpstream': matchedHitList[:, 0],
+                        'tofDownstream': matchedHitList[:, 1]}
+        return chunk
+    return match
+
+
+def writeSink(waveformWriter=None, hitsWriter=None, tofWriter=None):
+    def write(chunk):
+        with prof.stage('write', chunk['nEvents']):
+            if waveformWriter is not None:
+                waveformWriter.write(chunk)
+            if hitsWriter is not None:
+                hitsWriter.write({name: chunk['hits'][name] for name in cfd.hitDtype.names})
+            if tofWriter is not None:
+                tofWriter.write(chunk['tof'])
+    return write
+
+
+def openWriters(waveformPath, hitsPath, tofPath, nsamples, attributes, storage):
+    writers = [None, None, None]
+    if waveformPath is not None:
+        writers[0] = wio.openWriter(waveformPath, prod.productionColumns(nsamples), attributes=attributes, **storage)
+    if hitsPath is not None:
+        writers[1] = wio.openWriter(hitsPath, hitColumns, attributes=attributes, **storage)
+    if tofPath is not None:
+        writers[2] = wio.openWriter(tofPath, tofColumns, attributes=attributes, **storage)
+    return writers
+
+
+def closeWriters(writers):
+    for aWriter in writers:
+        if aWriter is not None:
+            aWriter.close()
+
+
+def simulate(nEvents, waveformPath=None, hitsPath=None, tofPath=None, chunkSize=1000, queueSize=2, seed=None,
+             config=None, recoConfig=None, storage=None):
+    config = dict(prod.defaultConfig, **(config or {}))
+    recoConfig = dict(reco.defaultRecoConfig, **(recoConfig or {}))
+    writers = openWriters(waveformPath, hitsPath, tofPath, config['nsamples'], dict(config, **recoConfig),
+                          storage or {})
+    try:
+        pipeline = Pipeline(source=generateChunks(nEvents, chunkSize, config, seed=seed),
+                            stages=[['digitize', digitizeStage(config)],
+                                    ['hitFind', hitFindStage(recoConfig)],
+                                    ['match', matchStage(recoConfig)]],
+                            sink=writeSink(*writers),
+                            queueSize=queueSize)
+        return pipeline.run()
+    finally:
+        closeWriters(writers)
+
+
+def replay(inputPath, hitsPath=None, tofPath=None, chunkSize=1000, queueSize=2, nEvents=None, recoConfig=None,
+           storage=None):
+    with wio.openReader(inputPath) as reader:
+        recoConfig = reco.runRecoConfig(reader, recoConfig)
+    writers = openWriters(None, hitsPath, tofPath, None, recoConfig, storage or {})
+    try:
+        pipeline = Pipeline(source=replayChunks(inputPath, chunkSize, nEvents=nEvents),
+                            stages=[['hitFind', hitFindStage(recoConfig)],
+                                    ['match', matchStage(recoConfig)]],
+                            sink=writeSink(*writers),
+                            queueSize=queueSize)
+        return pipeline.run()
+    finally:
+        closeWriters(writers)
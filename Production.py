@@ -0,0 +1,108 @@
+import os
+import time
+from multiprocessing import get_context
+
+import numpy as np
+
+import Profiling as prof
+import SiPMWaveGen as swg
+import WaveformIO as wio
+
+defaultConfig = dict(dt=0.2,
+                     nsamples=1024,
+                     speAmplitude=0.15,
+                     noiseSigmaInVolt=0.02,
+                     riseTime=0.8,
+                     fallTime=3.,
+                     nBits=12,
+                     voltMin=-0.8,
+                     dynamicRange=1.,
+                     offset=1000)
+
+
+def productionColumns(nsamples):
+    return {'adcUpstream': wio.columnSpec(np.uint16, [nsamples]),
+            'adcDownstream': wio.columnSpec(np.uint16, [nsamples]),
+            'trueUpstream': wio.columnSpec(np.uint16, [nsamples]),
+            'trueDownstream': wio.columnSpec(np.uint16, [nsamples]),
+            'nhitsUpstream': wio.columnSpec(np.int16),
+            'nhitsDownstream': wio.columnSpec(np.int16),
+            'timestamp': wio.columnSpec(np.int64)}
+
+
+def eventTimestamps(nEvents, start, stop):
+    # A batch is simulated at once, so its events are spread evenly over the time it took to generate them.
+    return start + np.arange(nEvents, dtype=np.int64) * max(stop - start, 0) // max(nEvents, 1)
+
+
+def generateEvents(nEvents, rng, config):
+    columns = {}
+    start = time.time_ns()
+    for channel in ['Upstream', 'Downstream']:
+        [t, digital_p, digital_true_p, nhits] = swg.aDigitizedTriggerBatch(nEvents=nEvents, rng=rng, **config)
+        columns['adc' + channel] = digital_p
+        columns['true' + channel] = digital_true_p
+        columns['nhits' + channel] = nhits
+    columns['timestamp'] = eventTimestamps(nEvents, start, time.time_ns())
+    return columns
+
+
+def chunkPath(outputPath, iChunk):
+    [root, ext] = os.path.splitext(outputPath.rstrip(os.sep))
+    return '{0}.chunk{1:04d}{2}'.format(root, iChunk, ext)
+
+
+def produceChunk(nEvents, seedSequence, path, config, storage, batchSize=1000):
+    rng = np.random.default_rng(seedSequence)
+    with wio.openWriter(path, productionColumns(config['nsamples']), attributes=config, **storage) as writer:
+        for start in range(0, nEvents, batchSize):
+            events = generateEvents(min(batchSize, nEvents - start), rng=rng, config=config)
+            with prof.stage('write', np.size(events['timestamp'])):
+                writer.write(events)
+    return path
+
+
+def runJobs(pool, function, jobs, progress=None, cancelled=None, pollInterval=0.1):
+    # pool.starmap(function, jobs) that reports progress(done, total) as jobs finish and returns None as soon
+    # as cancelled() turns true; the caller's Pool context then terminates the remaining workers.
+    if progress is None and cancelled is None:
+        return prof.mapProfiled(pool, function, jobs)
+    pending = [pool.apply_async(function, job) for job in jobs]
+    results = []
+    for aJob in pending:
+        while not aJob.ready():
+            if cancelled is not None and cancelled():
+                return None
+            aJob.wait(pollInterval)
+        results.append(aJob.get())
+        if progress is not None:
+            progress(len(results), len(jobs))
+    return results
+
+
+def produceEvents(nEvents, outputPath, nWorkers=None, seed=None, chunkSize=10000, config=None, writerChunkSize=1000,
+                  compression='zlib', compressionLevel=6, progress=None, cancelled=None):
+    # Every chunk gets its own child of one SeedSequence, so a given (seed, chunkSize) reproduces the same
+    # events whatever the number of workers. Returns None, leaving no output, if cancelled() turns true
+    # before the chunks are merged.
+    config = dict(defaultConfig, **(config or {}))
+    storage = dict(chunkSize=writerChunkSize, compression=compression, compressionLevel=compressionLevel)
+    seedSequence = np.random.SeedSequence(seed)
+
+    nChunks = max(1, -(-nEvents // chunkSize))
+    chunkSizes = [min(chunkSize, nEvents - iChunk * chunkSize) for iChunk in range(nChunks)]
+    chunkPaths = [chunkPath(outputPath, iChunk) for iChunk in range(nChunks)]
+    jobs = list(zip(chunkSizes, seedSequence.spawn(nChunks), chunkPaths, [config] * nChunks, [storage] * nChunks))
+
+    # Spawned rather than forked: the GUI starts production from a worker thread, and forking a process with
+    # live Qt and BLAS threads can leave the children deadlocked on locks those threads held.
+    with get_context('spawn').Pool(nWorkers) as pool:
+        completed = runJobs(pool, produceChunk, jobs, progress=progress, cancelled=cancelled)
+    if completed is not None:
+        with prof.stage('merge', nEvents):
+            wio.mergeRuns(chunkPaths, outputPath, **storage)
+    for path in chunkPaths:
+        if os.path.exists(path):
+            wio.removeRun(path)
+
+    return None if completed is None else seedSequence.entropy
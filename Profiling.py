@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Opt-in per-stage instrumentation. Library code wraps its stages in stage(name, nEvents); while no profiler is
+# enabled that is a single global lookup returning a shared no-op context. Allocation tracking uses tracemalloc
+# and is only switched on when asked for, since tracing every allocation slows NumPy-heavy code noticeably.
+
+activeProfiler = None
+disabledStage = nullcontext()
+
+
+class Profiler:
+
+    def __init__(self, trackAllocations=False):
+        self.trackAllocations = trackAllocations
+        self.records = []
+        self.local = threading.local()
+
+    @contextmanager
+    def stage(self, name, nEvents=0):
+        # allocated is the peak traced memory above the stage's starting point. tracemalloc is process-wide,
+        # so stages running concurrently in other threads are included in each other's peaks.
+        if self.trackAllocations:
+            # Each open stage keeps [start, peak]. A nested stage resets tracemalloc's peak for itself, so the
+            # peak reached so far is folded into the enclosing stage first and the inner peak on the way out.
+            openStages = self.local.__dict__.setdefault('openStages', [])
+            if openStages:
+                openStages[-1][1] = max(openStages[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            openStages.append([tracemalloc.get_traced_memory()[0], 0])
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            allocated = 0
+            if self.trackAllocations:
+                [before, peak] = openStages.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if openStages:
+                    openStages[-1][1] = max(openStages[-1][1], peak)
+                allocated = peak - before
+            self.records.append([name, start, duration, int(nEvents), allocated, os.getpid(),
+                                 threading.get_ident()])
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def summary(self):
+        stages = {}
+        for [name, start, duration, nEvents, allocated, pid, tid] in self.records:
+            aStage = stages.setdefault(name, {'calls': 0, 'seconds': 0., 'nEvents': 0, 'allocated': 0})
+            aStage['calls'] = aStage['calls'] + 1
+            aStage['seconds'] = aStage['seconds'] + duration * 1E-9
+            aStage['nEvents'] = aStage['nEvents'] + nEvents
+            aStage['allocated'] = max(aStage['allocated'], allocated)
+        return stages
+
+    def formatSummary(self):
+        stages = self.summary()
+        total = sum(aStage['seconds'] for aStage in stages.values()) or 1.
+        lines = ['{0:<16}{1:>8}{2:>12}{3:>8}{4:>12}{5:>14}{6:>12}'.format('stage', 'calls', 'seconds', '%', 'events',
+                                                                         'events/s', 'peak MiB')]
+        for name, aStage in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+            rate = aStage['nEvents'] / aStage['seconds'] if aStage['seconds'] > 0 else 0.
+            lines.append('{0:<16}{1:>8}{2:>12.3f}{3:>8.1f}{4:>12}{5:>14.1f}{6:>12}'.format(
+                name, aStage['calls'], aStage['seconds'], 100 * aStage['seconds'] / total, aStage['nEvents'], rate,
+                '{0:.2f}'.format(aStage['allocated'] / 2 ** 20) if self.trackAllocations else '-'))
+        return '\n'.join(lines)
+
+    def chromeTrace(self):
+        # Complete ('X') events in microseconds, loadable in chrome://tracing or Perfetto.
+        origin = min((aRecord[1] for aRecord in self.records), default=0)
+        events = [{'name': name, 'ph': 'X', 'ts': (start - origin) / 1E3, 'dur': duration / 1E3, 'pid': pid,
+                   'tid': tid, 'args': {'nEvents': nEvents, 'allocated': allocated}}
+                  for [name, start, duration, nEvents, allocated, pid, tid] in self.records]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def writeChromeTrace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chromeTrace(), f)
+
+
+def enable(trackAllocations=False):
+    global activeProfiler
+    if trackAllocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    activeProfiler = Profiler(trackAllocations=trackAllocations)
+    return activeProfiler
+
+
+def disable():
+    global activeProfiler
+    profiler = activeProfiler
+    activeProfiler = None
+    if profiler is not None and profiler.trackAllocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return profiler
+
+
+def stage(name, nEvents=0):
+    profiler = activeProfiler
+    return disabledStage if profiler is None else profiler.stage(name, nEvents)
+
+
+def runProfiled(function, args, trackAllocations=False):
+    # Worker-side wrapper for multiprocessing jobs: returns [result, records] so the parent can merge them.
+    profiler = enable(trackAllocations=trackAllocations)
+    try:
+        result = function(*args)
+    finally:
+        disable()
+    return [result, profiler.records]
+
+
+def mapProfiled(pool, function, jobs):
+    # pool.starmap that carries the workers' stage records back into the active profiler, if there is one.
+    profiler = activeProfiler
+    if profiler is None:
+        return pool.starmap(function, jobs)
+    results = pool.starmap(runProfiled, [(function, job, profiler.trackAllocations) for job in jobs])
+    for [result, records] in results:
+        profiler.extend(records)
+    return [result for [result, records] in results]
@@ -0,0 +1,115 @@
+from multiprocessing import get_context
+
+import numpy as np
+
+import CFDHitFinder as cfd
+import Profiling as prof
+import TimeMatcher as tm
+import WaveformIO as wio
+
+defaultRecoConfig = dict(dt=0.2,
+                         noiseSigmaInVolt=0.02,
+                         cfdThreshold=0.4,
+                         nNoiseSigmaThreshold=3.,
+                         sgWindow=15,
+                         cfdInterpolation='midpoint',
+                         coincidenceWindowLowerLim=10.,
+                         coincidenceWindowUpperLim=50.,
+                         pedestalDecay=0.,
+                         nBits=12,
+                         dynamicRange=1.,
+                         offset=1000)
+
+channelColumns = ['adcUpstream', 'adcDownstream']
+# Digitizer settings and noise level a run stores (Production writes its config), which reconstruct it better
+# than the defaults.
+runConfigAttributes = ['dt', 'noiseSigmaInVolt', 'nBits', 'dynamicRange', 'offset']
+
+
+def runRecoConfig(reader, config=None):
+    # defaultRecoConfig, overridden by the run's stored attributes (ROOT files carry none), overridden by config.
+    attributes = getattr(reader, 'attributes', {})
+    stored = {name: attributes[name] for name in runConfigAttributes if name in attributes}
+    runConfig = dict(defaultRecoConfig, **stored)
+    runConfig.update(config or {})
+    return runConfig
+
+
+def makePedestals(config):
+    # pedestalDecay=0 estimates every waveform's pedestal on its own, otherwise each channel carries a running
+    # estimate across the events it sees.
+    if config['pedestalDecay'] <= 0:
+        return [None, None]
+    return [cfd.RunningPedestal(decay=config['pedestalDecay'], nBits=config['nBits'],
+                                dynamicRange=config['dynamicRange'], offset=config['offset'])
+            for channel in channelColumns]
+
+
+def reconstructEvents(adcUpstream, adcDownstream, firstEvent, config, pedestals=None):
+    pedestals = pedestals or makePedestals(config)
+    hits = [cfd.HitFinderBatch(p=adc,
+                               noiseSigmaInVolt=config['noiseSigmaInVolt'],
+                               cfdThreshold=config['cfdThreshold'],
+                               nNoiseSigmaThreshold=config['nNoiseSigmaThreshold'],
+                               sgWindow=config['sgWindow'],
+                               cfdInterpolation=config['cfdInterpolation'],
+                               channel=channel,
+                               firstEvent=firstEvent,
+                               dt=config['dt'],
+                               nBits=config['nBits'],
+                               dynamicRange=config['dynamicRange'],
+                               pedestal=pedestals[channel]) for channel, adc in enumerate([adcUpstream, adcDownstream])]
+
+    with prof.stage('matching', np.shape(adcUpstream)[0]):
+        [matchedHitList, matchedEvent] = tm.TimeMatchingBatch(
+            hitListUpstream=hits[0]['cfdTime'],
+            hitListDownstream=hits[1]['cfdTime'],
+            coincidenceWindowLowerLim=config['coincidenceWindowLowerLim'],
+            coincidenceWindowUpperLim=config['coincidenceWindowUpperLim'],
+            eventUpstream=hits[0]['event'],
+            eventDownstream=hits[1]['event'])
+
+    return {'hits': np.concatenate(hits),
+            'tofEvent': matchedEvent,
+            'tofUpstream': matchedHitList[:, 0],
+            'tofDownstream': matchedHitList[:, 1]}
+
+
+def jobRanges(nEvents, chunkSize, config):
+    # [start, stop) of each worker job. Running pedestals carry their state from event to event, so with them the
+    # whole range is one job read window by window, which keeps the results independent of chunkSize.
+    if config['pedestalDecay'] > 0:
+        return [(0, nEvents)] if nEvents > 0 else []
+    return [(start, min(start + chunkSize, nEvents)) for start in range(0, nEvents, chunkSize)]
+
+
+def reconstructRange(path, start, stop, config, windowSize=None):
+    # Runs in a worker: uncompressed runs are memory-mapped, so only this range's pages are ever touched.
+    windowSize = windowSize or stop - start
+    pedestals = makePedestals(config)
+    results = []
+    with wio.openReader(path) as reader:
+        for windowStart in range(start, stop, windowSize):
+            windowStop = min(windowStart + windowSize, stop)
+            with prof.stage('read', windowStop - windowStart):
+                columns = reader.readEvents(windowStart, windowStop, columns=channelColumns)
+            results.append(reconstructEvents(columns[channelColumns[0]], columns[channelColumns[1]], windowStart,
+                                             config, pedestals=pedestals))
+    return {name: np.concatenate([aResult[name] for aResult in results]) for name in results[0]}
+
+
+def reconstructRun(path, nWorkers=None, chunkSize=1000, nEvents=None, config=None):
+    with wio.openReader(path) as reader:
+        config = runRecoConfig(reader, config)
+        nEvents = reader.nEvents if nEvents is None else min(nEvents, reader.nEvents)
+    if nEvents == 0:
+        return {'hits': np.zeros(0, dtype=cfd.hitDtype),
+                'tofEvent': np.zeros(0, dtype=np.int64),
+                'tofUpstream': np.zeros(0),
+                'tofDownstream': np.zeros(0)}
+    jobs = [(path, start, stop, config, chunkSize) for [start, stop] in jobRanges(nEvents, chunkSize, config)]
+
+    with get_context('spawn').Pool(nWorkers) as pool:
+        results = prof.mapProfiled(pool, reconstructRange, jobs)
+
+    return {name: np.concatenate([aResult[name] for aResult in results]) for name in results[0]}
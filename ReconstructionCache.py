@@ -0,0 +1,57 @@
+import inspect
+
+import numpy as np
+
+import CFDHitFinder as cfd
+from LRUCache import LRUCache
+
+# Memoized single-waveform hit finding for interactive use. Results are keyed by (event, channel, hit finder
+# parameters), where event is any hashable id the caller keeps unique per waveform. Discriminator output and
+# the pulse table are cached under the parameters they depend on, so moving only the CFD fraction or
+# interpolation reruns just the crossing search.
+
+# HitFinder's keyword defaults, so a call that spells out a default shares its entry with one that leaves it out.
+hitFinderDefaults = {name: parameter.default for name, parameter in inspect.signature(cfd.HitFinder).parameters.items()
+                     if parameter.default is not inspect.Parameter.empty}
+cfdParameters = ('cfdThreshold', 'cfdInterpolation')
+
+
+class ReconstructionCache:
+
+    def __init__(self, maxSize=256):
+        self.discriminations = LRUCache(maxSize=maxSize)
+        self.hits = LRUCache(maxSize=maxSize)
+
+    def key(self, event, channel, **parameters):
+        return (event, channel) + tuple(sorted(dict(hitFinderDefaults, **parameters).items()))
+
+    def __contains__(self, key):
+        return key in self.hits
+
+    def findHits(self, event, channel, p, **parameters):
+        # Same parameters and results as cfd.HitFinder. Running pedestals carry state from waveform to waveform,
+        # so calls with one are not cached.
+        parameters = dict(hitFinderDefaults, **parameters)
+        if parameters['pedestal'] is not None:
+            return cfd.HitFinder(p=p, **parameters)
+        return self.hits.getOrCompute(self.key(event, channel, **parameters),
+                                      lambda: self.computeHits(event, channel, p, parameters))
+
+    def computeHits(self, event, channel, p, parameters):
+        discrimination = {name: value for name, value in parameters.items() if name not in cfdParameters}
+        [hitLogic, baseline, noiseSigma, pulses] = self.discriminations.getOrCompute(
+            (event, channel) + tuple(sorted(discrimination.items())), lambda: self.discriminate(p, discrimination))
+        return cfd.FindHits(p, hitLogic, baseline, noiseSigma, cfdThreshold=parameters['cfdThreshold'],
+                            cfdInterpolation=parameters['cfdInterpolation'], backend=parameters['backend'],
+                            pulses=pulses)
+
+    def discriminate(self, p, discrimination):
+        # Everything up to and including the pulse peaks, none of which depends on the CFD settings.
+        [hitLogic, baseline, noiseSigma] = cfd.DiscriminatorConditioning(p=p, **discrimination)
+        pulses = cfd.FindPulses(np.reshape(p, (1, -1)), np.reshape(hitLogic, (1, -1)), np.reshape(baseline, 1),
+                                backend=discrimination['backend'])
+        return [hitLogic, baseline, noiseSigma, pulses]
+
+    def clear(self):
+        self.discriminations.clear()
+        self.hits.clear()
@@ -2,6 +2,9 @@ from math import exp
 
 import numpy as np
 
+import Profiling as prof
+from LRUCache import LRUCache
+
 
 def peResponse(t, delay, nphotons, speAmplitude, riseTime, fallTime):
     if t < delay:
@@ -11,31 +14,100 @@ def peResponse(t, delay, nphotons, speAmplitude, riseTime, fallTime):
 
 
 def waveGen(t, speAmplitude, noiseSigmaInVolt, riseTime, fallTime):
-    response = np.array([0 for ti in t])
-    true_response = np.array([0 for ti in t])
-    nhits = 0
-
-    while True:
-        nhits = np.random.poisson(1)
-        if nhits > 0:
-            break
-
-    while True:
-        checkSumHits = 0
-        for aHit in range(0, nhits):
-            delay = np.random.uniform(t[50], t[-50])
-            nphotons = np.random.poisson(3)
-            checkSumHits = checkSumHits + nphotons
-            true_response = true_response + np.array([peResponse(ti,
-                                                                 delay,
-                                                                 nphotons,
-                                                                 speAmplitude,
-                                                                 riseTime,
-                                                                 fallTime) for ti in t])
-        if checkSumHits > 0:
-            break
-
-    response = true_response + np.array([np.random.normal(0, noiseSigmaInVolt) for ti in t])
+    [response, true_response, nhits] = waveGenBatch(t, 1,
+                                                    speAmplitude=speAmplitude,
+                                                    noiseSigmaInVolt=noiseSigmaInVolt,
+                                                    riseTime=riseTime,
+                                                    fallTime=fallTime)
+
+    return [response[0], true_response[0], nhits[0]]
+
+
+class SPETemplateCache:
+
+    def __init__(self, maxSize=16, oversample=16, tailFraction=1E-6):
+        self.oversample = oversample
+        self.tailFraction = tailFraction
+        self.templates = LRUCache(maxSize=maxSize)
+
+    def getTemplate(self, riseTime, fallTime, dt):
+        return self.templates.getOrCompute((riseTime, fallTime, dt),
+                                           lambda: self.makeTemplate(riseTime, fallTime, dt))
+
+    def makeTemplate(self, riseTime, fallTime, dt):
+        # Unit-amplitude SPE shape sampled every dt/oversample, cut once the tail falls below tailFraction.
+        length = int(np.ceil(-fallTime * np.log(self.tailFraction) / dt)) + 1
+        tau = np.arange(length * self.oversample + 1) * (dt / self.oversample)
+        return np.exp(-tau / fallTime) * (1 - np.exp(-tau / riseTime))
+
+    def addPulses(self, out, t, rows, delay, amplitude, riseTime, fallTime):
+        # Adds amplitude * SPE(t - delay) to out[rows], one pulse per row, linearly interpolating the
+        # oversampled template at the sub-sample phase of each delay.
+        dt = t[1] - t[0]
+        template = self.getTemplate(riseTime, fallTime, dt)
+        length = (np.size(template) - 1) // self.oversample
+
+        first = np.ceil((delay - t[0]) / dt).astype(int)
+        phase = np.clip((first * dt + t[0] - delay) * (self.oversample / dt), 0, self.oversample)
+        base = np.minimum(np.floor(phase).astype(int), self.oversample - 1)
+        weight = (phase - base)[:, None]
+
+        index = base[:, None] + np.arange(length) * self.oversample
+        values = template[index] * (1 - weight) + template[index + 1] * weight
+        values *= np.reshape(amplitude, (-1, 1))
+
+        cols = first[:, None] + np.arange(length)
+        inRange = cols < np.shape(out)[1]
+        out[np.broadcast_to(np.reshape(rows, (-1, 1)), cols.shape)[inRange], cols[inRange]] += values[inRange]
+
+
+speTemplateCache = SPETemplateCache()
+
+# Hits are delayed uniformly between the hitMargin-th sample and the hitMargin-th from the end.
+hitMargin = 50
+
+
+def legacyRng():
+    # A Generator seeded from the legacy global state, so callers that seed with np.random.seed and leave rng
+    # out keep getting reproducible triggers.
+    return np.random.default_rng(np.random.randint(0, 2 ** 63 - 1, dtype=np.int64))
+
+
+def waveGenBatch(t, nEvents, speAmplitude, noiseSigmaInVolt, riseTime, fallTime, meanHits=1, meanPhotons=3,
+                 rng=None, templateCache=None):
+    # Same model as the original per-sample waveGen: at least one hit per trigger, Poisson photons per hit
+    # (redrawn until the trigger has at least one photon), uniform delays and white Gaussian noise.
+    nsamples = np.size(t)
+    if nsamples <= 2 * hitMargin:
+        raise ValueError('t must have more than {0} samples to place hits {1} samples from either end, '
+                         'got {2}'.format(2 * hitMargin, hitMargin, nsamples))
+    if rng is None:
+        rng = legacyRng()
+    if templateCache is None:
+        templateCache = speTemplateCache
+
+    nhits = rng.poisson(meanHits, nEvents)
+    redraw = nhits == 0
+    while np.any(redraw):
+        nhits[redraw] = rng.poisson(meanHits, np.count_nonzero(redraw))
+        redraw = nhits == 0
+
+    maxHits = np.max(nhits) if nEvents > 0 else 0
+    hitMask = np.arange(maxHits) < nhits[:, None]
+    delays = rng.uniform(t[hitMargin], t[-hitMargin], (nEvents, maxHits))
+    nphotons = rng.poisson(meanPhotons, (nEvents, maxHits)) * hitMask
+    redraw = np.sum(nphotons, axis=1) == 0
+    while np.any(redraw):
+        nphotons[redraw] = rng.poisson(meanPhotons, (np.count_nonzero(redraw), maxHits)) * hitMask[redraw]
+        redraw = np.sum(nphotons, axis=1) == 0
+
+    true_response = np.zeros((nEvents, nsamples))
+    for aHit in range(0, maxHits):
+        rows = np.nonzero(nphotons[:, aHit])[0]
+        templateCache.addPulses(true_response, t, rows, delay=delays[rows, aHit],
+                                amplitude=-nphotons[rows, aHit] * speAmplitude, riseTime=riseTime, fallTime=fallTime)
+
+    response = true_response + rng.normal(0, noiseSigmaInVolt, (nEvents, nsamples))
 
     return [response, true_response, nhits]
 
@@ -53,8 +125,24 @@ def getADC(p, nBits, res, voltMin):
     return guessADC
 
 def digitizeWave(p, nBits, voltMin, dynamicRange, offset):
-    resolution = dynamicRange / (2**nBits - 1)
-    return np.array([(getADC(pi, nBits=nBits, res=resolution, voltMin=voltMin) + offset) for pi in p])
+    return digitizeWaveInto(p, np.empty(np.shape(p), dtype=int), nBits=nBits, voltMin=voltMin,
+                            dynamicRange=dynamicRange, offset=offset)
+
+
+def digitizeWaveInto(p, out, nBits, voltMin, dynamicRange, offset, work=None):
+    # Whole-array equivalent of getADC: np.rint rounds half to even like the builtin round.
+    # work is a float scratch buffer shaped like p; pass work=p to digitize in place and destroy p.
+    resolution = dynamicRange / (2 ** nBits - 1)
+    if work is None:
+        work = np.empty(np.shape(p))
+    np.subtract(p, voltMin, out=work)
+    np.divide(work, resolution, out=work)
+    np.rint(work, out=work)
+    np.clip(work, 0, 2 ** nBits - 1, out=work)
+    np.add(work, offset, out=work)
+    np.copyto(out, work, casting='unsafe')
+    return out
+
 
 def aTrigger(dt, nsamples, speAmplitude, noiseSigmaInVolt, riseTime, fallTime):
     t = np.arange(0, nsamples*dt, dt)
@@ -73,4 +161,22 @@ def aDigitizedTrigger(dt, nsamples, speAmplitude, noiseSigmaInVolt, riseTime, fa
     digital_true_p = digitizeWave(true_p, nBits=nBits, voltMin=voltMin, dynamicRange=dynamicRange, offset=offset)
 
     # return [t, digital_p, digital_true_p, nhits]
-    return [t, digital_p, digital_true_p]
\ No newline at end of file
+    return [t, digital_p, digital_true_p]
+
+
+def aDigitizedTriggerBatch(dt, nsamples, nEvents, speAmplitude, noiseSigmaInVolt, riseTime, fallTime, nBits, voltMin,
+                           dynamicRange, offset, meanHits=1, meanPhotons=3, rng=None, dtype=np.uint16):
+    t = np.arange(0, nsamples*dt, dt)
+    with prof.stage('generation', nEvents):
+        [p, true_p, nhits] = waveGenBatch(t, nEvents, speAmplitude=speAmplitude, noiseSigmaInVolt=noiseSigmaInVolt,
+                                          riseTime=riseTime, fallTime=fallTime, meanHits=meanHits,
+                                          meanPhotons=meanPhotons, rng=rng)
+    with prof.stage('digitization', nEvents):
+        digital_p = np.empty(np.shape(p), dtype=dtype)
+        digital_true_p = np.empty(np.shape(true_p), dtype=dtype)
+        digitizeWaveInto(p, digital_p, nBits=nBits, voltMin=voltMin, dynamicRange=dynamicRange, offset=offset,
+                         work=p)
+        digitizeWaveInto(true_p, digital_true_p, nBits=nBits, voltMin=voltMin, dynamicRange=dynamicRange,
+                         offset=offset, work=true_p)
+
+    return [t, digital_p, digital_true_p, nhits]
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import numpy as np
+
+import Reconstruction as reco
+import WaveformIO as wio
+from LRUCache import LRUCache
+from ReconstructionCache import ReconstructionCache
+
+# Random access to single events of a stored run for browsing. Waveforms are read once into an LRU cache and
+# hit-found through a ReconstructionCache, so a prefetcher can fill both from worker threads ahead of the event
+# being looked at, and changing hit finder parameters only reruns what they affect.
+
+
+class StoredRun:
+
+    def __init__(self, path, config=None, cacheSize=64, backend='numpy', reconstructionCache=None):
+        self.path = path.rstrip(os.sep)
+        self.reader = wio.openReader(self.path)
+        self.nEvents = self.reader.nEvents
+        # Production stores its simulation config with the run; ROOT files carry none.
+        self.attributes = getattr(self.reader, 'attributes', {})
+        self.nsamples = self.reader.columns[reco.channelColumns[0]]['shape'][0]
+        self.config = reco.runRecoConfig(self.reader, config)
+        self.backend = backend
+        self.waveforms = LRUCache(maxSize=cacheSize)
+        if reconstructionCache is None:
+            reconstructionCache = ReconstructionCache(maxSize=2 * cacheSize)
+        self.reconstructionCache = reconstructionCache
+        self.readLock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        self.reader.__exit__(None, None, None)
+        self.waveforms.clear()
+
+    def hitFinderParameters(self, **parameters):
+        return dict(dict(noiseSigmaInVolt=self.config['noiseSigmaInVolt'],
+                         cfdThreshold=self.config['cfdThreshold'],
+                         nNoiseSigmaThreshold=self.config['nNoiseSigmaThreshold'],
+                         sgWindow=self.config['sgWindow'],
+                         cfdInterpolation=self.config['cfdInterpolation'],
+                         nBits=self.config['nBits'],
+                         dynamicRange=self.config['dynamicRange'],
+                         backend=self.backend), **parameters)
+
+    def isLoaded(self, event, **parameters):
+        parameters = self.hitFinderParameters(**parameters)
+        return all(self.reconstructionCache.key((self.path, event), channel, **parameters) in self.reconstructionCache
+                   for channel in range(len(reco.channelColumns)))
+
+    def load(self, event, **parameters):
+        # Returns one [p, hitStartIndexList, hitPeakAmplitude, hitPeakIndex, hitLogic, baseline, noiseSigma] per
+        # channel, the hit finder results in the same order as cfd.HitFinder. parameters override the run's
+        # hit finder configuration.
+        if not 0 <= event < self.nEvents:
+            raise IndexError('event {0} is outside {1} with {2} events'.format(event, self.path, self.nEvents))
+        parameters = self.hitFinderParameters(**parameters)
+        return [[p] + self.reconstructionCache.findHits((self.path, event), channel, p, **parameters)
+                for channel, p in enumerate(self.waveforms.getOrCompute(event, lambda: self.readEvent(event)))]
+
+    def readEvent(self, event):
+        # Readers are not safe to share between threads (ROOT trees least of all), hit finding is.
+        with self.readLock:
+            columns = self.reader.readEvents(event, event + 1, columns=reco.channelColumns)
+        return [np.asarray(columns[name][0], dtype=float) for name in reco.channelColumns]
@@ -5,28 +5,69 @@ def CheckInCoincidenceWindow(hitStartUpstream,
                              hitListDownstream,
                              coincidenceWindowLowerLim,
                              coincidenceWindowUpperLim):
-    coincidenceList = []
-
-    for i_ds in range(0, np.size(hitListDownstream)):
-        timeDiff = hitListDownstream[i_ds] - hitStartUpstream
-        if (timeDiff - coincidenceWindowLowerLim >= 0) and (timeDiff - coincidenceWindowUpperLim <= 0):
-            coincidenceList = np.append(coincidenceList, hitListDownstream[i_ds])
-
-    return coincidenceList
+    hitListDownstream = np.asarray(hitListDownstream, dtype=float)
+    timeDiff = hitListDownstream - hitStartUpstream
+    inWindow = (timeDiff - coincidenceWindowLowerLim >= 0) & (timeDiff - coincidenceWindowUpperLim <= 0)
+    return hitListDownstream[inWindow]
 
 
 def TimeMatching(hitListUpstream,
                  hitListDownstream,
                  coincidenceWindowLowerLim,
                  coincidenceWindowUpperLim):
-    matchedHitList = np.zeros([1, 2])
-    for i_us in range(0, np.size(hitListUpstream)):
-        coincidenceList = CheckInCoincidenceWindow(hitStartUpstream=hitListUpstream[i_us],
-                                                   hitListDownstream=hitListDownstream,
-                                                   coincidenceWindowLowerLim=coincidenceWindowLowerLim,
-                                                   coincidenceWindowUpperLim=coincidenceWindowUpperLim)
-        for i_ds in range(0, np.size(coincidenceList)):
-            matchedHitList = np.append(matchedHitList, [[(hitListUpstream[i_us]), (coincidenceList[i_ds])]],
-                                       axis=0)
-
-    return matchedHitList
\ No newline at end of file
+    [matchedHitList, matchedEvent] = TimeMatchingBatch(hitListUpstream=hitListUpstream,
+                                                       hitListDownstream=hitListDownstream,
+                                                       coincidenceWindowLowerLim=coincidenceWindowLowerLim,
+                                                       coincidenceWindowUpperLim=coincidenceWindowUpperLim)
+
+    return matchedHitList
+
+
+def TimeMatchingBatch(hitListUpstream,
+                      hitListDownstream,
+                      coincidenceWindowLowerLim,
+                      coincidenceWindowUpperLim,
+                      eventUpstream=None,
+                      eventDownstream=None):
+    # Sorts the downstream hits once on a combined (event, time) key and brackets every upstream window with
+    # searchsorted. The bracket is widened by a few ulps of the key and the candidates are re-checked with the
+    # original window test, so rounding in the key never changes which pairs are accepted.
+    upstream = np.ravel(np.asarray(hitListUpstream, dtype=float))
+    downstream = np.ravel(np.asarray(hitListDownstream, dtype=float))
+    if eventUpstream is None:
+        eventUpstream = np.zeros(np.size(upstream), dtype=np.int64)
+    if eventDownstream is None:
+        eventDownstream = np.zeros(np.size(downstream), dtype=np.int64)
+    eventUpstream = np.ravel(eventUpstream)
+    eventDownstream = np.ravel(eventDownstream)
+
+    if np.size(upstream) == 0 or np.size(downstream) == 0:
+        return [np.zeros((0, 2)), np.zeros(0, dtype=np.int64)]
+
+    origin = min(np.min(upstream), np.min(downstream))
+    span = max(np.max(upstream), np.max(downstream)) - origin + abs(coincidenceWindowLowerLim) + \
+           abs(coincidenceWindowUpperLim) + 1
+    downstreamKey = eventDownstream * span + (downstream - origin)
+    order = np.argsort(downstreamKey, kind='stable')
+    downstreamKey = downstreamKey[order]
+    upstreamKey = eventUpstream * span + (upstream - origin)
+    tolerance = 4 * np.spacing(max(np.max(np.abs(downstreamKey)), np.max(np.abs(upstreamKey))) + span)
+
+    lower = np.searchsorted(downstreamKey, upstreamKey + coincidenceWindowLowerLim - tolerance, side='left')
+    upper = np.searchsorted(downstreamKey, upstreamKey + coincidenceWindowUpperLim + tolerance, side='right')
+    counts = np.maximum(upper - lower, 0)
+    offsets = np.cumsum(counts) - counts
+
+    upstreamIndex = np.repeat(np.arange(np.size(upstream)), counts)
+    downstreamIndex = order[np.arange(np.sum(counts)) - np.repeat(offsets, counts) + np.repeat(lower, counts)]
+    timeDiff = downstream[downstreamIndex] - upstream[upstreamIndex]
+    inWindow = (timeDiff - coincidenceWindowLowerLim >= 0) & (timeDiff - coincidenceWindowUpperLim <= 0) & \
+               (eventDownstream[downstreamIndex] == eventUpstream[upstreamIndex])
+    upstreamIndex = upstreamIndex[inWindow]
+    downstreamIndex = downstreamIndex[inWindow]
+
+    matchedHitList = np.empty((np.size(upstreamIndex), 2))
+    matchedHitList[:, 0] = upstream[upstreamIndex]
+    matchedHitList[:, 1] = downstream[downstreamIndex]
+
+    return [matchedHitList, eventUpstream[upstreamIndex]]
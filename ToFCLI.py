@@ -0,0 +1,122 @@
+import argparse
+import sys
+
+import numpy as np
+
+import Benchmark as bench
+import ParameterScan as scan
+import Pipeline as pl
+import Production as prod
+import Profiling as prof
+import Reconstruction as reco
+
+
+def addConfigArguments(parser, config, runDefaults=False):
+    # With runDefaults only the options given end up in the namespace, so the settings a run stores fill the rest.
+    group = parser.add_argument_group('parameters')
+    for name, value in config.items():
+        if not runDefaults:
+            group.add_argument('--' + name, type=type(value), default=value, help='default: %(default)s')
+        else:
+            group.add_argument('--' + name, type=type(value), default=argparse.SUPPRESS,
+                               help='default: {0}{1}'.format('the run\'s, else ' if name in reco.runConfigAttributes
+                                                             else '', value))
+
+
+def addProfilingArguments(parser):
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', action='store_true', help='print per-stage wall time and event counts')
+    group.add_argument('--profile-memory', action='store_true', help='also record per-stage allocations (slower)')
+    group.add_argument('--trace', default=None, help='write the stages as a Chrome-trace JSON file')
+
+
+def runProfiled(args, function):
+    if not (args.profile or args.profile_memory or args.trace):
+        return function(args)
+    profiler = prof.enable(trackAllocations=args.profile_memory)
+    try:
+        return function(args)
+    finally:
+        prof.disable()
+        print(profiler.formatSummary())
+        if args.trace is not None:
+            profiler.writeChromeTrace(args.trace)
+            print('Wrote trace of {0} stages to {1}'.format(len(profiler.records), args.trace))
+
+
+def simMain(argv=None):
+    parser = argparse.ArgumentParser(prog='tof-sim', description='Generate digitized upstream/downstream SiPM '
+                                                                  'triggers without the GUI.')
+    parser.add_argument('-n', '--nevents', type=int, default=2000)
+    parser.add_argument('-o', '--output', default='Waveform.root', help='.root file or run directory')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='default: all cores')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=10000, help='events per production job')
+    parser.add_argument('--writer-chunk-size', type=int, default=1000, help='events per stored chunk')
+    parser.add_argument('--compression', default='zlib', help='none, zlib, bz2 or lzma (lz4/zstd for ROOT)')
+    parser.add_argument('--compression-level', type=int, default=6)
+    stream = parser.add_argument_group('streaming', 'Giving --hits or --tof runs generation and reconstruction as '
+                                                    'one threaded pipeline; --nevents 0 streams until interrupted.')
+    stream.add_argument('--hits', default=None, help='run directory for the hits table')
+    stream.add_argument('--tof', default=None, help='run directory for matched ToF pairs')
+    stream.add_argument('--queue-size', type=int, default=2, help='chunks buffered between stages')
+    addConfigArguments(parser, prod.defaultConfig)
+    addConfigArguments(parser, {name: value for name, value in reco.defaultRecoConfig.items()
+                                if name not in prod.defaultConfig})
+    addProfilingArguments(parser)
+    return runProfiled(parser.parse_args(argv), simulate)
+
+
+def simulate(args):
+    config = {name: getattr(args, name) for name in prod.defaultConfig}
+    if args.hits is not None or args.tof is not None:
+        recoConfig = {name: getattr(args, name) for name in reco.defaultRecoConfig}
+        storage = dict(chunkSize=args.writer_chunk_size, compression=args.compression,
+                       compressionLevel=args.compression_level)
+        try:
+            nChunks = pl.simulate(args.nevents if args.nevents > 0 else None, waveformPath=args.output,
+                                  hitsPath=args.hits, tofPath=args.tof, chunkSize=args.writer_chunk_size,
+                                  queueSize=args.queue_size, seed=args.seed, config=config, recoConfig=recoConfig,
+                                  storage=storage)
+        except KeyboardInterrupt:
+            print('Interrupted, outputs closed at the last complete chunk')
+            return 130
+        print('Streamed {0} chunks to {1}'.format(nChunks, args.output))
+        return 0
+
+    entropy = prod.produceEvents(args.nevents, args.output, nWorkers=args.workers, seed=args.seed,
+                                 chunkSize=args.chunk_size, config=config, writerChunkSize=args.writer_chunk_size,
+                                 compression=args.compression, compressionLevel=args.compression_level)
+    print('Wrote {0} events to {1} (seed {2})'.format(args.nevents, args.output, entropy))
+    return 0
+
+
+def recoMain(argv=None):
+    parser = argparse.ArgumentParser(prog='tof-reco', description='Find hits and match time-of-flight pairs in a '
+                                                                   'stored run without the GUI.')
+    parser.add_argument('input', help='.root file or run directory written by tof-sim')
+    parser.add_argument('-o', '--output', default='Hits.npz')
+    parser.add_argument('-n', '--nevents', type=int, default=None, help='default: all events')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='default: all cores')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    addConfigArguments(parser, reco.defaultRecoConfig, runDefaults=True)
+    addProfilingArguments(parser)
+    return runProfiled(parser.parse_args(argv), reconstruct)
+
+
+def reconstruct(args):
+    config = {name: getattr(args, name) for name in reco.defaultRecoConfig if hasattr(args, name)}
+    results = reco.reconstructRun(args.input, nWorkers=args.workers, chunkSize=args.chunk_size, nEvents=args.nevents,
+                                  config=config)
+    np.savez(args.output, **results)
+    print('Wrote {0} hits and {1} matched pairs to {2}'.format(np.size(results['hits']),
+                                                               np.size(results['tofEvent']),
+                                                               args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    commands = {'sim': simMain, 'reco': recoMain, 'bench': bench.benchMain, 'scan': scan.scanMain}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        sys.exit('usage: ToFCLI.py {sim,reco,bench,scan} ...')
+    sys.exit(commands[sys.argv[1]](sys.argv[2:]))
@@ -0,0 +1,315 @@
+import bz2
+import json
+import lzma
+import os
+import shutil
+import zlib
+
+import numpy as np
+
+# A run is a directory holding meta.json plus one data stream per column. Uncompressed columns are a single
+# contiguous <column>.bin, compressed columns are one blob per chunk in <column>/<chunk>.z. ROOT files are
+# handled by the same interface when the path ends in .root.
+
+formatName = 'tof-waveform'
+formatVersion = 1
+
+compressors = {'zlib': (zlib.compress, zlib.decompress),
+               'bz2': (bz2.compress, bz2.decompress),
+               'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress)}
+
+rootCompressionAlgorithms = {'none': 0, 'zlib': 1, 'lzma': 2, 'lz4': 4, 'zstd': 5}
+
+rootLeafTypes = {'uint8': 'b', 'int8': 'B', 'uint16': 's', 'int16': 'S', 'uint32': 'i', 'int32': 'I',
+                 'uint64': 'l', 'int64': 'L', 'float32': 'F', 'float64': 'D'}
+
+rootLeafTypeNames = {'UChar_t': 'uint8', 'Char_t': 'int8', 'UShort_t': 'uint16', 'Short_t': 'int16',
+                     'UInt_t': 'uint32', 'Int_t': 'int32', 'ULong64_t': 'uint64', 'Long64_t': 'int64',
+                     'Float_t': 'float32', 'Double_t': 'float64'}
+
+
+def isROOTPath(path):
+    return path.endswith('.root')
+
+
+def columnSpec(dtype, shape=()):
+    return {'dtype': np.dtype(dtype).str, 'shape': list(shape)}
+
+
+class WaveformWriter:
+
+    def __init__(self, path, columns, chunkSize=1000, compression='zlib', compressionLevel=6, attributes=None):
+        if compression != 'none' and compression not in compressors:
+            raise ValueError('Unknown compression {0!r}'.format(compression))
+        self.path = path
+        self.columns = columns
+        self.chunkSize = chunkSize
+        self.compression = compression
+        self.compressionLevel = compressionLevel
+        self.attributes = attributes or {}
+        self.chunks = []
+        self.nEvents = 0
+
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            shutil.rmtree(path)
+        elif os.path.isdir(path) and os.listdir(path):
+            raise FileExistsError('{0} is a non-empty directory that is not a run'.format(path))
+        os.makedirs(path, exist_ok=True)
+        self.buffers = {name: np.empty([chunkSize] + spec['shape'], dtype=spec['dtype'])
+                        for name, spec in columns.items()}
+        self.nBuffered = 0
+        self.streams = {}
+        for name in columns:
+            if compression == 'none':
+                self.streams[name] = open(os.path.join(path, name + '.bin'), 'wb')
+            else:
+                os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def write(self, data):
+        nEvents = np.shape(data[next(iter(self.columns))])[0]
+        written = 0
+        while written < nEvents:
+            n = min(self.chunkSize - self.nBuffered, nEvents - written)
+            for name in self.columns:
+                self.buffers[name][self.nBuffered:self.nBuffered + n] = data[name][written:written + n]
+            self.nBuffered = self.nBuffered + n
+            written = written + n
+            if self.nBuffered == self.chunkSize:
+                self.flush()
+
+    def flush(self):
+        if self.nBuffered == 0:
+            return
+        for name in self.columns:
+            chunk = np.ascontiguousarray(self.buffers[name][:self.nBuffered])
+            if self.compression == 'none':
+                self.streams[name].write(chunk.tobytes())
+            else:
+                compress = compressors[self.compression][0]
+                with open(chunkFile(self.path, name, len(self.chunks)), 'wb') as f:
+                    f.write(compress(chunk.tobytes(), self.compressionLevel))
+        self.chunks.append(self.nBuffered)
+        self.nEvents = self.nEvents + self.nBuffered
+        self.nBuffered = 0
+
+    def close(self):
+        self.flush()
+        for stream in self.streams.values():
+            stream.close()
+        self.streams = {}
+        meta = {'format': formatName,
+                'version': formatVersion,
+                'nEvents': self.nEvents,
+                'chunkSize': self.chunkSize,
+                'chunks': self.chunks,
+                'compression': self.compression,
+                'compressionLevel': self.compressionLevel,
+                'columns': self.columns,
+                'attributes': self.attributes}
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+
+class WaveformReader:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != formatName:
+            raise ValueError('{0} is not a {1} run'.format(path, formatName))
+        self.nEvents = meta['nEvents']
+        self.chunkSize = meta['chunkSize']
+        self.chunks = meta['chunks']
+        self.compression = meta['compression']
+        self.compressionLevel = meta['compressionLevel']
+        self.columns = meta['columns']
+        self.attributes = meta['attributes']
+        self.chunkStarts = np.concatenate([[0], np.cumsum(self.chunks)]).astype(int)
+        self.memmaps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.memmaps = {}
+
+    def memmap(self, column):
+        # Read-only (nEvents, ...) view of an uncompressed column; slicing it never copies or loads the run.
+        if self.compression != 'none':
+            raise ValueError('{0} is stored with {1} compression and cannot be memory-mapped'.format(self.path,
+                                                                                                    self.compression))
+        if column not in self.memmaps:
+            spec = self.columns[column]
+            if self.nEvents == 0 or 0 in spec['shape']:
+                # np.memmap cannot map an empty file.
+                return np.empty([self.nEvents] + spec['shape'], dtype=spec['dtype'])
+            self.memmaps[column] = np.memmap(os.path.join(self.path, column + '.bin'), dtype=spec['dtype'],
+                                             mode='r', shape=tuple([self.nEvents] + spec['shape']))
+        return self.memmaps[column]
+
+    def iterWindows(self, windowSize, columns=None, start=0, stop=None):
+        stop = self.nEvents if stop is None else min(stop, self.nEvents)
+        for windowStart in range(start, stop, windowSize):
+            yield [windowStart, self.readEvents(windowStart, min(windowStart + windowSize, stop), columns)]
+
+    def read(self, column, start=0, stop=None):
+        # Uncompressed runs return a zero-copy memmap slice, otherwise only the chunks overlapping
+        # [start, stop) are read and decompressed.
+        stop = self.nEvents if stop is None else min(stop, self.nEvents)
+        start = min(start, stop)
+        spec = self.columns[column]
+        dtype = np.dtype(spec['dtype'])
+        shape = spec['shape']
+
+        if self.compression == 'none':
+            return self.memmap(column)[start:stop]
+
+        out = np.empty([stop - start] + shape, dtype=dtype)
+        decompress = compressors[self.compression][1]
+        first = np.searchsorted(self.chunkStarts, start, side='right') - 1
+        for iChunk in range(max(first, 0), len(self.chunks)):
+            chunkStart = self.chunkStarts[iChunk]
+            if chunkStart >= stop:
+                break
+            with open(chunkFile(self.path, column, iChunk), 'rb') as f:
+                chunk = np.frombuffer(decompress(f.read()), dtype=dtype).reshape([self.chunks[iChunk]] + shape)
+            lo = max(start, chunkStart)
+            hi = min(stop, chunkStart + self.chunks[iChunk])
+            out[lo - start:hi - start] = chunk[lo - chunkStart:hi - chunkStart]
+        return out
+
+    def readEvents(self, start=0, stop=None, columns=None):
+        return {name: self.read(name, start, stop) for name in (columns or self.columns)}
+
+
+class ROOTWaveformWriter:
+
+    def __init__(self, path, columns, chunkSize=1000, compression='zlib', compressionLevel=6, attributes=None):
+        from ROOT import TFile, TTree
+
+        if compression not in rootCompressionAlgorithms:
+            raise ValueError('Unknown ROOT compression {0!r}'.format(compression))
+        self.path = path
+        self.columns = columns
+        # TFile reads a setting below 100 as a zlib level, so 'none' has to be 0 rather than 0 * 100 + level.
+        setting = 0 if compression == 'none' else rootCompressionAlgorithms[compression] * 100 + compressionLevel
+        self.file = TFile(path, 'RECREATE', '', setting)
+        self.tree = TTree('Waveform', 'ToF Simulation')
+        self.tree.SetAutoFlush(chunkSize)
+        self.buffers = {}
+        for name, spec in columns.items():
+            dtype = np.dtype(spec['dtype'])
+            self.buffers[name] = np.zeros(max(int(np.prod(spec['shape'], dtype=int)), 1), dtype=dtype)
+            dimensions = ''.join('[{0}]'.format(n) for n in spec['shape'])
+            self.tree.Branch(name, self.buffers[name], '{0}{1}/{2}'.format(name, dimensions, rootLeafTypes[dtype.name]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def write(self, data):
+        for i in range(np.shape(data[next(iter(self.columns))])[0]):
+            for name in self.columns:
+                self.buffers[name][:] = np.ravel(data[name][i])
+            self.tree.Fill()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.Write()
+        self.file.Close()
+        self.file = None
+
+
+class ROOTWaveformReader:
+
+    def __init__(self, path):
+        from ROOT import TFile
+
+        self.path = path
+        self.file = TFile(path)
+        self.tree = self.file.Get('Waveform')
+        self.nEvents = int(self.tree.GetEntries())
+        self.columns = {}
+        for aLeaf in self.tree.GetListOfLeaves():
+            shape = [aLeaf.GetLen()] if aLeaf.GetLen() > 1 else []
+            self.columns[aLeaf.GetName()] = columnSpec(rootLeafTypeNames[aLeaf.GetTypeName()], shape)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.file.Close()
+
+    def read(self, column, start=0, stop=None):
+        return self.readEvents(start, stop, [column])[column]
+
+    def iterWindows(self, windowSize, columns=None, start=0, stop=None):
+        stop = self.nEvents if stop is None else min(stop, self.nEvents)
+        for windowStart in range(start, stop, windowSize):
+            yield [windowStart, self.readEvents(windowStart, min(windowStart + windowSize, stop), columns)]
+
+    def readEvents(self, start=0, stop=None, columns=None):
+        stop = self.nEvents if stop is None else min(stop, self.nEvents)
+        start = min(start, stop)
+        columns = columns or list(self.columns)
+        out = {name: np.empty([stop - start] + self.columns[name]['shape'], dtype=self.columns[name]['dtype'])
+               for name in columns}
+        for entry in range(start, stop):
+            self.tree.GetEntry(entry)
+            for name in columns:
+                out[name][entry - start] = np.asarray(getattr(self.tree, name))
+        return out
+
+
+def chunkFile(path, column, iChunk):
+    return os.path.join(path, column, '{0:06d}.z'.format(iChunk))
+
+
+def openWriter(path, columns, chunkSize=1000, compression='zlib', compressionLevel=6, attributes=None):
+    writer = ROOTWaveformWriter if isROOTPath(path) else WaveformWriter
+    return writer(path, columns, chunkSize=chunkSize, compression=compression, compressionLevel=compressionLevel,
+                  attributes=attributes)
+
+
+def openReader(path):
+    return ROOTWaveformReader(path) if isROOTPath(path) else WaveformReader(path)
+
+
+def removeRun(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def mergeRuns(inputPaths, outputPath, chunkSize=1000, compression='zlib', compressionLevel=6):
+    if isROOTPath(outputPath):
+        from ROOT import TFileMerger
+
+        merger = TFileMerger(False)
+        merger.OutputFile(outputPath, 'RECREATE')
+        for path in inputPaths:
+            merger.AddFile(path)
+        if not merger.Merge():
+            raise RuntimeError('Failed to merge runs into {0}'.format(outputPath))
+        return
+
+    with WaveformReader(inputPaths[0]) as first:
+        columns = first.columns
+        attributes = first.attributes
+    with WaveformWriter(outputPath, columns, chunkSize=chunkSize, compression=compression,
+                        compressionLevel=compressionLevel, attributes=attributes) as writer:
+        for path in inputPaths:
+            with WaveformReader(path) as reader:
+                for start in range(0, reader.nEvents, chunkSize):
+                    writer.write(reader.readEvents(start, start + chunkSize))
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import CFDHitFinder as cfd
+import NumbaKernels as nk
+import SiPMWaveGen as swg
+
+# The numpy and numba hit finder backends must give identical hit tables. Run with
+# python -m pytest testBackendParity.py (the name is outside pytest's default test_*.py discovery).
+
+needsNumba = pytest.mark.skipif(not nk.available, reason='Numba is not installed')
+
+dt = 0.2
+nsamples = 1024
+noiseSigmaInVolt = 0.02
+
+
+def simulatedTriggers(nEvents=300):
+    [t, adc, true_adc, nhits] = swg.aDigitizedTriggerBatch(dt=dt, nsamples=nsamples, nEvents=nEvents,
+                                                           speAmplitude=0.15, noiseSigmaInVolt=noiseSigmaInVolt,
+                                                           riseTime=0.8, fallTime=3., nBits=12, voltMin=-0.8,
+                                                           dynamicRange=1., offset=1000,
+                                                           rng=np.random.default_rng(0))
+    return adc
+
+
+def edgeTriggers():
+    # One pulse per row, its onset swept from before the first sample to past the last, so pulses are cut off or
+    # peak at sample 0 and at the last sample.
+    rng = np.random.default_rng(1)
+    onsets = np.concatenate([np.arange(-20, 5), np.arange(nsamples - 25, nsamples + 1)])
+    t = (np.arange(nsamples) - onsets[:, None]) * dt
+    pulse = np.where(t > 0, np.exp(-t / 3.) - np.exp(-np.maximum(t, 0) / 0.8), 0.)
+    volt = -0.3 * pulse / np.max(pulse) + rng.normal(0., noiseSigmaInVolt, np.shape(t))
+    return swg.digitizeWave(volt, nBits=12, voltMin=-0.8, dynamicRange=1., offset=1000)
+
+
+def findHits(adc, backend, **parameters):
+    return cfd.HitFinderBatch(adc, noiseSigmaInVolt=noiseSigmaInVolt, cfdThreshold=0.4, nNoiseSigmaThreshold=3.,
+                              dt=dt, backend=backend, **parameters)
+
+
+@needsNumba
+@pytest.mark.parametrize('sgFilter', [True, False])
+@pytest.mark.parametrize('mode', cfd.cfdInterpolationModes)
+def testSimulatedTriggers(mode, sgFilter):
+    adc = simulatedTriggers()
+    [numpyHits, numbaHits] = [findHits(adc, backend, cfdInterpolation=mode, sgFilter=sgFilter)
+                              for backend in cfd.backends]
+    assert np.size(numpyHits) > 0
+    assert np.array_equal(numpyHits, numbaHits)
+
+
+@needsNumba
+@pytest.mark.parametrize('sgFilter', [True, False])
+@pytest.mark.parametrize('mode', cfd.cfdInterpolationModes)
+def testPulsesAtTheEdges(mode, sgFilter):
+    adc = edgeTriggers()
+    [numpyHits, numbaHits] = [findHits(adc, backend, cfdInterpolation=mode, sgFilter=sgFilter)
+                              for backend in cfd.backends]
+    # Pulses already under way at sample 0 are not hits, ones starting there cross within the first samples.
+    assert np.any(numpyHits['cfdTime'] < 2 * dt) and np.any(numpyHits['peakIndex'] == nsamples - 1)
+    assert np.array_equal(numpyHits, numbaHits)
+
+
+@pytest.mark.parametrize('sgWindow', [16, 4, 2, 15.5])
+@pytest.mark.parametrize('backend', [backend for backend in cfd.backends if backend != 'numba' or nk.available])
+def testInvalidWindowsAreRefused(backend, sgWindow):
+    with pytest.raises(ValueError):
+        findHits(simulatedTriggers(10), backend, sgWindow=sgWindow)
+
+
+@needsNumba
+def testRunningPedestal():
+    # The numba kernel sums the histogram in another order, so only agreement to rounding is expected.
+    adc = simulatedTriggers()
+    [numpyPedestal, numbaPedestal] = [cfd.RunningPedestal(decay=0.99, backend=backend) for backend in cfd.backends]
+    for start in range(0, np.shape(adc)[0], 100):
+        [numpyEstimate, numbaEstimate] = [pedestal.update(adc[start:start + 100])
+                                          for pedestal in [numpyPedestal, numbaPedestal]]
+        assert np.allclose(numpyEstimate, numbaEstimate, rtol=1e-9, atol=0)